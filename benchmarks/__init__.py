@@ -0,0 +1,5 @@
+'''
+Benchmarks for dank420
+
+Run one with `python -m benchmarks.<name>` from the repository root
+'''
@@ -0,0 +1,56 @@
+'''
+Compares filtering with lookupy's `evaluate` against the compiled lookups
+used by `CollectionView.filter`
+
+    python -m benchmarks.bench_filter [number of items]
+'''
+import sys
+import time
+import random
+import lookupy
+
+from dank420.collection import Item
+from dank420.lookups import compile_lookups
+
+
+QUERIES = {
+    'exact': [lookupy.Q(category='code')],
+    'gt + startswith': [lookupy.Q(order__gt=500, title__startswith='Post 1')],
+    'nested': [lookupy.Q(meta__author='sam')],
+    'or tree': [lookupy.Q(category='code') | ~lookupy.Q(order__lt=900)],
+}
+
+
+def make_items(n):
+    rng = random.Random(420)
+    return [Item(
+        title=f'Post {i}',
+        order=rng.randrange(1000),
+        category=rng.choice(['code', 'life', 'nix']),
+        meta={'author': rng.choice(['sam', 'alex'])},
+    ) for i in range(n)]
+
+
+def _time(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main(n):
+    items = make_items(n)
+    print(f'Filtering {n} items')
+    for name, lookups in QUERIES.items():
+        evaluate = lambda item: all(l.evaluate(item) for l in lookups)
+        compiled = compile_lookups(lookups)
+
+        old_time, old = _time(lambda: [x for x in items if evaluate(x)])
+        new_time, new = _time(lambda: [x for x in items if compiled(x)])
+        assert old == new
+
+        print('{:>16}: lookupy {:.3f}s, compiled {:.3f}s ({:.1f}x)'.format(
+            name, old_time, new_time, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
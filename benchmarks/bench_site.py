@@ -0,0 +1,172 @@
+'''
+Times the main operations of dank420 on a generated site (see
+`benchmarks.synthetic`), and compares them against a saved baseline
+
+    python -m benchmarks.bench_site [--posts N] [--static-files M]
+    python -m benchmarks.bench_site --save-baseline
+
+Results are compared with the baseline file (default
+`benchmarks/baseline.json`) when it exists.  If any benchmark is slower
+than the baseline by more than the tolerance, the differences are printed
+and it exits with status 1.  Baselines depend on the machine, so save one
+on the machine you compare on; they are not kept in the repository.
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+from dank420 import static
+from . import synthetic
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+@contextlib.contextmanager
+def _chdir(dirname):
+    old = os.getcwd()
+    os.chdir(dirname)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+def _best_of(repeat, fn, setup=None):
+    '''
+    Returns the fastest time of `repeat` runs of fn
+    '''
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _clear_static_caches():
+    static._hash_caches.clear()
+    static._transform_cache.clear()
+
+
+def run(posts, static_files, repeat):
+    '''
+    Returns a dict of benchmark name -> seconds
+    '''
+    results = {}
+    with tempfile.TemporaryDirectory() as dirname, _chdir(dirname):
+        synthetic.generate('.', posts=posts, static_files=static_files)
+        site, collection = synthetic.make_site()
+
+        results['FileCollection.load'] = _best_of(
+            repeat, lambda: synthetic.PostsCollection().load())
+
+        view = collection.filter(category='code').sort('order', reverse=True)
+        results['CollectionView.filter+sort'] = _best_of(
+            repeat, lambda: list(view), setup=collection.mark_changed)
+        results['CollectionView.filter+sort (cached)'] = _best_of(
+            repeat, lambda: list(view))
+
+        static_view = [h for h in site.router.all()
+                       if issubclass(h, static.StaticView)][0]
+        results['StaticView hashing (cold)'] = _best_of(
+            repeat, lambda: static_view().get_all_paths(),
+            setup=_clear_static_caches)
+        results['StaticView hashing (warm)'] = _best_of(
+            repeat, lambda: static_view().get_all_paths())
+
+        paths = [path for handler in site.router.all()
+                 for path in handler().get_all_paths()]
+
+        def find_all():
+            for path in paths:
+                assert site.router.find(path) is not None
+        results['Router.find (all paths)'] = _best_of(
+            repeat, find_all, setup=site.router.invalidate)
+
+        def build():
+            site.build('out', force=True)
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            results['Site.build'] = _best_of(repeat, build)
+        shutil.rmtree('out')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Returns a list of messages for benchmarks that regressed
+    '''
+    regressions = []
+    for name, seconds in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if seconds > base * (1 + tolerance):
+            regressions.append('{}: {:.4f}s, baseline {:.4f}s ({:+.0f}%)'.format(
+                name, seconds, base, (seconds / base - 1) * 100))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--posts', default=2000, type=int)
+    parser.add_argument('--static-files', default=1000, type=int)
+    parser.add_argument('--repeat', default=3, type=int,
+            help='Runs of each benchmark; the fastest is kept')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+            help='Save the results as the baseline')
+    parser.add_argument('--tolerance', default=0.2, type=float,
+            help='Allowed slowdown, as a fraction of the baseline')
+    args = parser.parse_args(argv)
+
+    results = run(args.posts, args.static_files, args.repeat)
+    params = {'posts': args.posts, 'static_files': args.static_files}
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print('Baseline was made with {}; not comparing'.format(
+                baseline.get('params')))
+            baseline = None
+
+    for name, seconds in results.items():
+        line = '{:>36}: {:.4f}s'.format(name, seconds)
+        base = baseline and baseline['results'].get(name)
+        if base:
+            line += ' (baseline {:.4f}s, {:+.0f}%)'.format(
+                base, (seconds / base - 1) * 100)
+        print(line)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params, 'results': results}, f,
+                      indent=2, sort_keys=True)
+        print('Saved baseline to', args.baseline)
+        return 0
+
+    if baseline is not None:
+        regressions = compare(results, baseline['results'], args.tolerance)
+        if regressions:
+            print()
+            print('!' * 60)
+            print('REGRESSIONS (more than {:.0f}% slower than baseline):'.format(
+                args.tolerance * 100))
+            for message in regressions:
+                print('  ' + message)
+            print('!' * 60)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
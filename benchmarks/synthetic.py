@@ -0,0 +1,177 @@
+'''
+Generates synthetic sites of any size, for benchmarking
+
+The site has markdown-ish posts with front matter, static files in nested
+folders and templates that link to them with `static_url`.  Everything is
+generated from a seed, so the same arguments always give the same site.
+Only dank420's own dependencies are used (no markdown or yaml).
+'''
+import os
+import random
+
+from dank420 import Site, View, Pathspec
+from dank420 import static
+from dank420 import collection
+
+CATEGORIES = ['code', 'life', 'nix', 'music', 'travel']
+TAGS = ['python', 'gtk', 'linux', 'web', 'perf', 'css', 'rust', 'jinja']
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+
+TEMPLATES = {
+    'base.html': '''<!doctype html>
+<html>
+<head>
+<link rel="stylesheet" href="{{ "css/main.css" | static_url }}">
+<script src="{{ "js/app.js" | static_url }}"></script>
+</head>
+<body>{% block body %}{% endblock %}</body>
+</html>
+''',
+    'index.html': '''{% extends "base.html" %}
+{% block body %}
+<ul>
+{% for post in posts %}
+  <li><a href="{{ post.main_url }}">{{ post.title }}</a> {{ post.category }}</li>
+{% endfor %}
+</ul>
+{% endblock %}
+''',
+    'post.html': '''{% extends "base.html" %}
+{% block body %}
+<h1>{{ post.title }}</h1>
+<img src="{{ "img/header.svg" | static_url }}">
+<p>{% for tag in post.tags %}{{ tag }} {% endfor %}</p>
+<article>{{ post.content }}</article>
+{% endblock %}
+''',
+}
+
+
+def _paragraph(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate(dirname, posts=1000, static_files=500, seed=420):
+    '''
+    Write a synthetic site's files into a directory
+
+    Args:
+        dirname (str): directory to write into; `posts`, `static` and
+            `templates` folders are made in it
+        posts (int): number of posts
+        static_files (int): number of static files, spread over nested
+            folders
+        seed (int): seed for the random content
+    '''
+    rng = random.Random(seed)
+
+    for name, text in TEMPLATES.items():
+        path = os.path.join(dirname, 'templates', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    for i in range(posts):
+        # Some nesting, like posts sorted into years
+        path = os.path.join(dirname, 'posts', str(2010 + i % 8), f'{i}.md')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tags = rng.sample(TAGS, rng.randrange(1, 4))
+        body = '\n\n'.join(_paragraph(rng, rng.randrange(20, 200))
+                           for _ in range(rng.randrange(2, 10)))
+        with open(path, 'w') as f:
+            f.write('---\n')
+            f.write(f'title: Post number {i}\n')
+            f.write(f'order: {rng.randrange(100000)}\n')
+            f.write(f'category: {rng.choice(CATEGORIES)}\n')
+            f.write(f'tags: {",".join(tags)}\n')
+            f.write('---\n')
+            f.write(body)
+
+    fixed = {
+        'css/main.css': 'body { color: #420; }\n' * 50,
+        'js/app.js': 'console.log("dank");\n' * 50,
+        'img/header.svg': '<svg xmlns="http://www.w3.org/2000/svg"></svg>\n',
+    }
+    for i in range(max(0, static_files - len(fixed))):
+        depth = rng.randrange(1, 4)
+        folders = [f'd{rng.randrange(10)}' for _ in range(depth)]
+        name = os.path.join(*folders, f'file{i}.{rng.choice(["css", "js", "txt"])}')
+        fixed[name] = _paragraph(rng, rng.randrange(10, 2000))
+    for name, text in fixed.items():
+        path = os.path.join(dirname, 'static', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+
+class PostItem(collection.FileCollectionItem):
+    def __init__(self, fname):
+        header, offset = collection.read_front_matter(fname)
+        metadata = {}
+        for line in header.splitlines():
+            key, _, value = line.partition(':')
+            metadata[key.strip()] = value.strip()
+        metadata['order'] = int(metadata['order'])
+        metadata['tags'] = metadata['tags'].split(',')
+        super().__init__(fname, body_offset=offset, **metadata)
+
+    @property
+    def main_url(self):
+        return '/blog/' + os.path.splitext(os.path.basename(self.filename))[0]
+
+
+class PostsCollection(collection.FileCollection):
+    path = './posts/**/*.md'
+    Item = PostItem
+
+
+def make_site():
+    '''
+    Returns a Site for a generated site.  Paths are relative, so this must
+    be called (and the site used) with the generated directory as the
+    working directory.
+
+    Returns:
+        tuple of the Site, and the posts collection
+    '''
+    site = Site()
+    posts = PostsCollection()
+    sorted_posts = posts.sort('order')
+
+    @site.register
+    class IndexView(View):
+        def dispatch(self, request):
+            return request.site.templates.render('index.html', posts=sorted_posts)
+
+        def get_all_paths(self):
+            return ['/']
+
+    @site.register
+    class BlogPostView(collection.ItemPerPageView):
+        collection = sorted_posts
+
+        def dispatch(self, request):
+            item = self.get_item_for_request(request)
+            return request.site.templates.render('post.html', post=item)
+
+        def get_path_for_item(self, item):
+            return item.main_url
+
+    @site.register
+    class CategoryView(View):
+        pathspec = Pathspec('/category/<name>')
+
+        def dispatch(self, request):
+            name = self.pathspec.match(request.path)['name']
+            return request.site.templates.render(
+                'index.html', posts=sorted_posts.filter(category=name))
+
+        def get_all_paths(self):
+            return [self.pathspec.format(name=c) for c in CATEGORIES]
+
+    @site.register
+    class MyStaticView(static.StaticView):
+        base = 'static'
+
+    return site, posts
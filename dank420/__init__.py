@@ -1,20 +1,26 @@
 import os
 import re
 import sys
+import time
 import shutil
 import argparse
+import threading
+import traceback
 from pprint import pprint
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import fnmatch
 
 from .view import View
-from .pathspec import Pathspec
+from .pathspec import Pathspec, PathspecSet
 from .request import Request
 from .router import Router
-from .response import Response, force_response
+from .response import Response, FileResponse, force_response
 from .devserver import run_dev_server
 from .templates import Templates
+from .builder import Builder, BuildError, build_atomic, has_manifest
+from .profiling import BuildProfile
+from . import util
 
 
 class Site():
@@ -23,24 +29,109 @@ class Site():
     '''
 
     class _WatchDogHandler(FileSystemEventHandler):
-        def __init__(self):
+        '''
+        Collects file changes, and calls the reload callbacks in batches
+
+        Changes are gathered until none have come in for `debounce`
+        seconds; so saving lots of files at once (eg. a git checkout) runs
+        each callback once per changed file, rather than for every event
+        '''
+        debounce = 0.1
+
+        # Events that mean a file changed.  Others (eg. `opened` and
+        # `closed_no_write`) come from just reading files; such as the
+        # development server reading a page's inputs
+        change_event_types = {'created', 'modified', 'deleted', 'moved',
+                              'closed'}
+
+        def __init__(self, site):
+            self.site = site
+            # (compiled pattern or None, fn, batch)
             self.callbacks = []
+            # Ordered set of changed absolute paths
+            self._pending = {}
+            self._last_event = 0
+            self._cond = threading.Condition()
 
         def on_any_event(self, event):
-            # FIXME: this is probably broken for move events
-            path = event.src_path
-            for cb, pattern in self.callbacks:
-                if fnmatch.fnmatch(path, pattern):
-                    cb(path)
+            if event.event_type not in self.change_event_types:
+                return
+            # Directories are modified when their files are; those files
+            # have events of their own
+            if event.is_directory and event.event_type == 'modified':
+                return
+            paths = [event.src_path]
+            # Moves change both the old and new paths
+            dest_path = getattr(event, 'dest_path', None)
+            if dest_path:
+                paths.append(dest_path)
+            with self._cond:
+                for path in paths:
+                    if isinstance(path, bytes):
+                        path = os.fsdecode(path)
+                    self._pending[os.path.abspath(path)] = None
+                self._last_event = time.monotonic()
+                self._cond.notify()
+
+        def run(self):
+            while True:
+                with self._cond:
+                    while not self._pending:
+                        self._cond.wait()
+                    # Wait for the changes to settle
+                    while True:
+                        quiet = time.monotonic() - self._last_event
+                        if quiet >= self.debounce:
+                            break
+                        self._cond.wait(self.debounce - quiet)
+                    paths = list(self._pending)
+                    self._pending.clear()
+                try:
+                    self.call_callbacks(paths)
+                except Exception:
+                    traceback.print_exc()
+
+        def call_callbacks(self, paths):
+            '''
+            Call the callbacks for the given changed paths
+            '''
+            changed = False
+            for regex, fn, batch in self.callbacks:
+                matched = [p for p in paths
+                           if regex is None or regex.match(p)]
+                if not matched:
+                    continue
+                # Callbacks for every change (like the development server's
+                # cache) don't mean that the site's paths changed
+                if regex is not None:
+                    changed = True
+                if batch:
+                    fn(matched)
+                else:
+                    for path in matched:
+                        fn(path)
+            if changed:
+                # The change could have added or removed paths
+                self.site.router.invalidate()
+
+    def __init__(self, template_cache_dir=None):
+        '''
+        Args:
 
-    def __init__(self):
+            * template_cache_dir (str or None): directory to keep compiled
+              templates in between runs
+        '''
         self.router = Router()
-        self.templates = Templates(self)
+        self.templates = Templates(self, bytecode_cache_dir=template_cache_dir)
+
+        self._watchdog_handler = self._WatchDogHandler(self)
+        # Directories to watch (absolute paths), once watching starts
+        self._watch_roots = set()
+        self._observer = None
+        self._watch_lock = threading.Lock()
 
-        self._watchdog_handler = self._WatchDogHandler()
-        observer = Observer()
-        observer.schedule(self._watchdog_handler, path='.', recursive=True)
-        observer.start()
+        self.register_reload_callback(self.templates._reload_cb,
+                os.path.join(self.templates.path, '*'))
 
     def register(self, handler):
         '''
@@ -62,31 +153,51 @@ class Site():
         self.router.add(handler)
         return handler
 
-    def build(self, outdir, force=False):
-        if os.path.exists(outdir):
-            if force:
-                shutil.rmtree(outdir)
-            else:
-                raise Exception('Can not build; outdir exists')
-        os.makedirs(outdir)
+    def build(self, outdir, force=False, jobs=1, incremental=False,
+              atomic=False, compress=False, profile=None):
+        '''
+        Build the static site into a folder
 
-        for HandlerClass in self.router.all():
-            paths = HandlerClass().get_all_paths()
+        Args:
 
-            for path in paths:
-                request = Request(path, self)
+            * outdir (str): directory to write the site into
+            * force (bool): delete outdir first if it already exists
+            * jobs (int): number of processes to render pages with
+            * incremental (bool): build into an existing outdir, only
+              rendering the pages whose inputs changed since the last build
+            * atomic (bool): build into a staging copy of outdir, which
+              replaces outdir when the build is done.  Only files whose
+              content changed are written, so the others keep their mtime.
+              An existing outdir that was not made by a build is only
+              replaced with force
+            * compress (bool): also write gzip (and brotli, if the module
+              is installed) compressed copies of text files, for servers
+              that send precompressed files
+            * profile (BuildProfile or None): collect timings of the build
+              into this, eg. to save as a report
 
-                handler = HandlerClass()
-                resp = force_response(handler.dispatch(request))
+        Raises:
 
-                write_to = os.path.join(outdir, path.lstrip('/'))
-                if resp.is_html and not write_to.endswith('.html'):
-                    write_to = os.path.join(write_to, 'index.html')
+            BuildError if a page fails to render when jobs > 1
+        '''
+        if atomic:
+            # Only replace directories made by a build, unless forced
+            if os.path.exists(outdir) and not has_manifest(outdir) \
+                    and not force:
+                raise Exception('Can not build; outdir exists')
+            build_atomic(self, outdir, jobs=jobs, incremental=incremental,
+                    compress=compress, profile=profile)
+            return
 
-                print('Writing:', write_to)
-                os.makedirs(os.path.dirname(write_to), exist_ok=True)
-                with open(write_to, 'wb') as f:
-                    f.write(resp.data)
+        if os.path.exists(outdir) and not incremental:
+            if force:
+                shutil.rmtree(outdir)
+            else:
+                raise Exception('Can not build; outdir exists')
+        os.makedirs(outdir, exist_ok=True)
+
+        Builder(self, outdir, jobs=jobs, incremental=incremental,
+                compress=compress, profile=profile).run()
 
     def cli(self):
         parser = argparse.ArgumentParser()
@@ -108,6 +219,34 @@ class Site():
         build_parser.add_argument('--force', dest='force', action='store_true',
                 help=('If --force is used and outdir exists, '
                       'outdir will be deleted prior to building'))
+        build_parser.add_argument('--jobs', '-j', default=1, type=int,
+                help='Number of processes to render pages with')
+        build_parser.add_argument('--incremental', dest='incremental',
+                action='store_true',
+                help=('Reuse the existing outdir, only rendering pages '
+                      'whose inputs changed since the last build'))
+        build_parser.add_argument('--atomic', dest='atomic',
+                action='store_true',
+                help=('Build into a staging directory that replaces outdir '
+                      'at the end, only writing files that changed'))
+        build_parser.add_argument('--compress', dest='compress',
+                action='store_true',
+                help=('Also write .gz (and .br) compressed copies of text '
+                      'files, eg. for nginx gzip_static'))
+        build_parser.add_argument('--profile-report', dest='profile_report',
+                metavar='FILE',
+                help=('Write a json report of the time spent on each '
+                      'handler and path to FILE'))
+        build_parser.add_argument('--profile-slowest', dest='profile_slowest',
+                default=20, type=int,
+                help='Number of the slowest paths to list in the report')
+        build_parser.add_argument('--profile-cprofile',
+                dest='profile_cprofile', metavar='FILE',
+                help=('Also dump cProfile stats of the build to FILE '
+                      '(only the main process is profiled)'))
+        build_parser.add_argument('--profile-memory', dest='profile_memory',
+                action='store_true',
+                help='Also add the top memory allocations to the report')
 
         argv = sys.argv[1:]
         if len(argv) == 0:
@@ -124,7 +263,75 @@ class Site():
         elif args.subcommand_name == 'build':
             outdir = args.outdir
             assert outdir
-            self.build(outdir, force=args.force)
+            profile = None
+            if args.profile_report or args.profile_cprofile:
+                profile = BuildProfile(
+                        slowest=args.profile_slowest,
+                        cprofile_path=args.profile_cprofile,
+                        trace_memory=args.profile_memory)
+            self.build(outdir, force=args.force, jobs=args.jobs,
+                    incremental=args.incremental, atomic=args.atomic,
+                    compress=args.compress, profile=profile)
+            if args.profile_report:
+                profile.save(args.profile_report)
+
+    def register_reload_callback(self, fn, path, batch=False):
+        '''
+        Call a function when files change, while the development server
+        is running.  The directory holding the matching files is watched.
+
+        Args:
+
+            * fn (function): called with each changed path, or with a
+              list of the changed paths if batch is True
+            * path (str or None): glob of the files to call fn for.  If
+              None, fn is called for every change to the watched files
+            * batch (bool): call fn once per batch of changes
+        '''
+        regex = None
+        if path is not None:
+            regex = re.compile(fnmatch.translate(os.path.abspath(path)))
+            self.watch(util.glob_root(path))
+        self._watchdog_handler.callbacks.append((regex, fn, batch))
 
-    def register_reload_callback(self, fn, path):
-        self._watchdog_handler.callbacks.append((fn, path))
+    def watch(self, dirname):
+        '''
+        Watch a directory (and the ones under it) for changes, while the
+        development server is running
+        '''
+        dirname = os.path.abspath(dirname)
+        with self._watch_lock:
+            if dirname in self._watch_roots:
+                return
+            self._watch_roots.add(dirname)
+            if self._observer is not None:
+                self._schedule(dirname)
+
+    def _schedule(self, dirname):
+        # Already covered by a recursive watch
+        for root in self._watch_roots:
+            if root != dirname and \
+                    dirname.startswith(root.rstrip(os.sep) + os.sep):
+                return
+        # Watch the closest directory that exists, so that the files
+        # appearing later are seen
+        while not os.path.isdir(dirname) and dirname != os.path.dirname(dirname):
+            dirname = os.path.dirname(dirname)
+        self._observer.schedule(self._watchdog_handler, path=dirname,
+                recursive=True)
+
+    def start_watching(self):
+        '''
+        Start watching the files of the reload callbacks.  The
+        development server does this; building does not watch anything.
+        '''
+        with self._watch_lock:
+            if self._observer is not None:
+                return
+            self._observer = Observer()
+            for dirname in sorted(self._watch_roots):
+                self._schedule(dirname)
+            self._observer.start()
+        thread = threading.Thread(target=self._watchdog_handler.run,
+                daemon=True)
+        thread.start()
@@ -0,0 +1,562 @@
+import os
+import sys
+import json
+import shutil
+import time
+import errno
+import ctypes
+import tempfile
+import queue
+import filecmp
+import threading
+import mimetypes
+import collections
+import multiprocessing
+import multiprocessing.pool
+import traceback
+
+from .request import Request
+from .response import force_response, FileResponse
+from . import recorder
+from . import util
+from . import compress
+from . import profiling
+
+
+MANIFEST_NAME = '.dank420-manifest.json'
+_MANIFEST_VERSION = 1
+
+
+class BuildError(Exception):
+    '''
+    Raised when a handler fails to render a path during the build
+    '''
+    pass
+
+
+# The site being built by the worker processes.  Set by the parent right
+# before the pool is forked, so that the workers inherit it (along with
+# the loaded collections) rather than having it pickled across
+_worker_site = None
+
+
+def _render(site, HandlerClass, path):
+    '''
+    Returns a tuple of the response, the files and globs that were read
+    while rendering it, and the time spent in each stage
+    '''
+    request = Request(path, site)
+    handler = HandlerClass()
+    with recorder.Recorder() as rec, profiling.Timings() as timings:
+        with profiling.timed('dispatch'):
+            resp = force_response(handler.dispatch(request))
+    return resp, sorted(rec.files), sorted(rec.globs), dict(timings.seconds)
+
+
+def _render_in_worker(handler_index, path):
+    HandlerClass = list(_worker_site.router.all())[handler_index]
+    try:
+        return _render(_worker_site, HandlerClass, path)
+    except Exception:
+        # Exceptions raised by views are not always picklable, so send
+        # back a formatted one that always is
+        raise BuildError('{} failed rendering {}:\n{}'.format(
+            HandlerClass.__name__, path, traceback.format_exc()))
+
+
+def _close(results):
+    # Stops the render workers straight away if writing failed, rather
+    # than when the results are garbage collected
+    close = getattr(results, 'close', None)
+    if close is not None:
+        close()
+
+
+def _has_compressed(path, compressed):
+    '''
+    Returns True if the compressed copies listed for a file (as returned by
+    `compress.compress_file`) cover the current encodings and still exist
+    '''
+    if set(compressed) != {ext for ext, _ in compress.get_encodings()}:
+        return False
+    return all(os.path.isfile(path + ext)
+               for ext, (_, written) in compressed.items() if written)
+
+
+def _write_response(resp, path):
+    if isinstance(resp, FileResponse):
+        util.copy_file(resp.path, path)
+    else:
+        with open(path, 'wb') as f:
+            f.write(resp.data)
+
+
+def _has_content(path, resp):
+    '''
+    Returns True if the file at path has the same content as the response
+    '''
+    if not os.path.isfile(path):
+        return False
+    if isinstance(resp, FileResponse):
+        return filecmp.cmp(resp.path, path, shallow=False)
+    data = resp.data
+    if os.path.getsize(path) != len(data):
+        return False
+    with open(path, 'rb') as f:
+        return f.read() == data
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+# From <fcntl.h> and <linux/fs.h>
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+def _exchange(a, b):
+    '''
+    Atomically swap two paths, with renameat2(RENAME_EXCHANGE) on Linux
+
+    Returns:
+        False if the OS or filesystem can not do it
+    '''
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                          ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    if renameat2(_AT_FDCWD, os.fsencode(a), _AT_FDCWD, os.fsencode(b),
+                 _RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(err, os.strerror(err), a)
+
+
+def has_manifest(outdir):
+    '''
+    Returns True if outdir has a manifest; ie. it was made by a build
+    '''
+    return os.path.isfile(os.path.join(outdir, MANIFEST_NAME))
+
+
+def build_atomic(site, outdir, **kwargs):
+    '''
+    Build into a staging copy of outdir, and then swap it into place; so
+    the outdir is never half written
+
+    The staging copy starts as hard links to the current outdir, and only
+    files whose content changed are written.  Unchanged files keep their
+    mtime, so tools like rsync don't send them again.  Files in outdir that
+    are not outputs of the build are removed, so the caller must check
+    that it is fine to replace outdir (see `has_manifest`).
+
+    Args:
+        site (Site): the site to build
+        outdir (str): directory to build the site into; may exist
+        kwargs: passed to `Builder`
+    '''
+    outdir = os.path.abspath(outdir)
+    parent, name = os.path.split(outdir)
+    # Made next to outdir, so that renames stay on the same filesystem
+    staging = tempfile.mkdtemp(prefix=f'.{name}.staging-', dir=parent)
+    try:
+        if has_manifest(outdir):
+            shutil.copytree(outdir, staging, copy_function=_link_or_copy,
+                            dirs_exist_ok=True)
+        else:
+            # mkdtemp makes it private; use the usual mode for a new dir
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(staging, 0o777 & ~umask)
+        Builder(site, staging, skip_unchanged=True, **kwargs).run()
+
+        if os.path.isdir(outdir) and _exchange(staging, outdir):
+            # staging now holds the old site
+            return
+        # No atomic exchange here; outdir is only missing between renames
+        old = tempfile.mkdtemp(prefix=f'.{name}.old-', dir=parent)
+        try:
+            if os.path.exists(outdir):
+                os.rename(outdir, os.path.join(old, name))
+            os.rename(staging, outdir)
+        finally:
+            shutil.rmtree(old)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+
+
+class Builder():
+    '''
+    Renders every path of a site into a directory
+
+    Probably not a public API; use `Site.build`
+
+    A manifest of the inputs each output was rendered from is written into
+    the outdir.  For incremental builds, paths whose inputs are unchanged
+    are not rendered again, and outputs of paths that no longer exist are
+    removed.
+
+    Args:
+        site (Site): the site to build
+        outdir (str): directory to write the files into
+        jobs (int): number of worker processes to render with.  When
+            this is 1, everything is rendered in this process
+        incremental (bool): reuse the outputs already in outdir where
+            the manifest says they are up to date
+        skip_unchanged (bool): leave output files alone (keeping their
+            mtime) when they already have the right content, and replace
+            the others rather than writing into them.  Files in outdir that
+            are not outputs of the build are removed
+        compress (bool): write compressed copies (eg. `index.html.gz`) of
+            the outputs that are worth compressing
+        compress_workers (int or None): number of threads to compress
+            with; defaults to the number of CPUs
+        profile (profiling.BuildProfile or None): collects the timings of
+            the build
+    '''
+
+    def __init__(self, site, outdir, jobs=1, incremental=False,
+                 skip_unchanged=False, compress=False, compress_workers=None,
+                 profile=None):
+        self.site = site
+        self.outdir = outdir
+        self.jobs = jobs
+        self.incremental = incremental
+        self.skip_unchanged = skip_unchanged
+        self.compress = compress
+        self.compress_workers = compress_workers or os.cpu_count() or 1
+        self.profile = profile
+        # How many paths can be waiting on the pool at once.  Keeps
+        # memory flat when there are lots of pages
+        self.max_in_flight = jobs * 4
+        # Outputs are written on these threads, so rendering does not wait
+        # on the disk.  At most `max_queued_writes` rendered responses wait
+        # for them, which keeps memory flat
+        self.write_workers = 4
+        self.max_queued_writes = 64
+        self._made_dirs = set()
+        self._lock = threading.Lock()
+
+        # Fingerprints are cached for the length of the build, as many
+        # pages share the same templates and collections
+        self._file_fingerprints = {}
+        self._glob_fingerprints = {}
+
+    def _work_items(self):
+        for i, HandlerClass in enumerate(self.site.router.all()):
+            start = time.perf_counter()
+            paths = HandlerClass().get_all_paths()
+            if self.profile is not None:
+                self.profile.add_get_all_paths(
+                    HandlerClass, time.perf_counter() - start)
+            for path in paths:
+                yield i, HandlerClass, path
+
+    def _render_serial(self, work_items):
+        for _, HandlerClass, path in work_items:
+            yield (path, HandlerClass) + _render(self.site, HandlerClass, path)
+
+    def _render_parallel(self, work_items):
+        global _worker_site
+        _worker_site = self.site
+        # Fork so the workers share the parent's registered handlers and
+        # loaded collections
+        ctx = multiprocessing.get_context('fork')
+        pool = ctx.Pool(self.jobs)
+        try:
+            in_flight = collections.deque()
+            for i, HandlerClass, path in work_items:
+                in_flight.append((path, HandlerClass, pool.apply_async(
+                    _render_in_worker, (i, path))))
+                if len(in_flight) >= self.max_in_flight:
+                    path, HandlerClass, result = in_flight.popleft()
+                    yield (path, HandlerClass) + result.get()
+            while in_flight:
+                path, HandlerClass, result = in_flight.popleft()
+                yield (path, HandlerClass) + result.get()
+            pool.close()
+        finally:
+            # Stops the other workers straight away if one of them failed
+            pool.terminate()
+            pool.join()
+            _worker_site = None
+
+    def _site_fingerprint(self):
+        # Changing the site's code could change any page
+        main_file = getattr(sys.modules['__main__'], '__file__', None)
+        if main_file is None:
+            return None
+        return recorder.fingerprint_file(main_file)
+
+    def _file_fingerprint(self, path):
+        if path not in self._file_fingerprints:
+            self._file_fingerprints[path] = recorder.fingerprint_file(path)
+        return self._file_fingerprints[path]
+
+    def _glob_fingerprint(self, pattern):
+        if pattern not in self._glob_fingerprints:
+            self._glob_fingerprints[pattern] = \
+                recorder.fingerprint_glob(pattern)
+        return self._glob_fingerprints[pattern]
+
+    def _manifest_path(self):
+        return os.path.join(self.outdir, MANIFEST_NAME)
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if manifest.get('version') != _MANIFEST_VERSION:
+            return {}
+        if manifest.get('site') != self._site_fingerprint():
+            return {}
+        return manifest['pages']
+
+    def _save_manifest(self, pages):
+        manifest = {
+            'version': _MANIFEST_VERSION,
+            'site': self._site_fingerprint(),
+            'pages': pages,
+        }
+        # Replaced rather than written into, as it could be a hard link to
+        # the live site's manifest
+        path = self._manifest_path()
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _is_fresh(self, entry):
+        if not os.path.isfile(os.path.join(self.outdir, entry['output'])):
+            return False
+        for path, fingerprint in entry['files'].items():
+            if self._file_fingerprint(path) != fingerprint:
+                return False
+        for pattern, fingerprint in entry['globs'].items():
+            if self._glob_fingerprint(pattern) != fingerprint:
+                return False
+        return True
+
+    def _make_entry(self, output, content_type, files, globs):
+        return {
+            'output': output,
+            'content_type': content_type,
+            'files': {p: self._file_fingerprint(p) for p in files},
+            'globs': {p: self._glob_fingerprint(p) for p in globs},
+        }
+
+    def _write(self, path, resp):
+        '''
+        Write a response
+
+        Returns:
+            tuple of the output path relative to outdir, and the number of
+            bytes written
+        '''
+        output = path.lstrip('/')
+        if resp.is_html and not output.endswith('.html'):
+            output = os.path.join(output, 'index.html')
+        write_to = os.path.join(self.outdir, output)
+
+        if self.skip_unchanged and _has_content(write_to, resp):
+            return output, 0
+
+        print('Writing:', write_to)
+        self._makedirs(os.path.dirname(write_to))
+        if self.skip_unchanged:
+            # The file could be a hard link to the live site; replace it
+            # rather than writing into it
+            tmp_write_to = '{}.{}.tmp'.format(write_to, os.getpid())
+            _write_response(resp, tmp_write_to)
+            os.replace(tmp_write_to, write_to)
+        else:
+            _write_response(resp, write_to)
+        if not self.compress:
+            # Compressed copies from an earlier build are now out of date
+            compress.remove_compressed(write_to)
+        return output, os.path.getsize(write_to)
+
+    def _makedirs(self, dirname):
+        # Most pages go in directories that were already made
+        if dirname not in self._made_dirs:
+            os.makedirs(dirname, exist_ok=True)
+            self._made_dirs.add(dirname)
+
+    def _write_result(self, result, pages):
+        path, HandlerClass, resp, files, globs, seconds = result
+        start = time.perf_counter()
+        output, bytes_written = self._write(path, resp)
+        seconds['write'] = time.perf_counter() - start
+        entry = self._make_entry(output, resp.content_type, files, globs)
+        with self._lock:
+            pages[path] = entry
+            if self.profile is not None:
+                self.profile.add_path(path, HandlerClass, seconds,
+                                      bytes_written)
+
+    def _write_all(self, results, pages):
+        '''
+        Write the rendered results on the writer threads, adding their
+        manifest entries to pages
+
+        Raises:
+            the first error from writing, once the writers have stopped
+        '''
+        if self.write_workers <= 1:
+            try:
+                for result in results:
+                    self._write_result(result, pages)
+            finally:
+                _close(results)
+            return
+
+        writes = queue.Queue(self.max_queued_writes)
+        errors = []
+
+        def writer():
+            while True:
+                result = writes.get()
+                if result is None:
+                    return
+                # Keep taking them after an error, so the queue drains
+                if errors:
+                    continue
+                try:
+                    self._write_result(result, pages)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=writer, daemon=True)
+                   for _ in range(self.write_workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for result in results:
+                if errors:
+                    break
+                writes.put(result)
+        finally:
+            _close(results)
+            for _ in threads:
+                writes.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+    def _remove_stale(self, old_pages, pages):
+        outputs = {entry['output'] for entry in pages.values()}
+        for path, entry in old_pages.items():
+            if path in pages or entry['output'] in outputs:
+                continue
+            remove = os.path.join(self.outdir, entry['output'])
+            print('Removing:', remove)
+            for ext in [''] + list(entry.get('compressed', {})):
+                try:
+                    os.remove(remove + ext)
+                except FileNotFoundError:
+                    pass
+
+    def _remove_unlisted(self, pages):
+        keep = {MANIFEST_NAME}
+        for entry in pages.values():
+            output = os.path.normpath(entry['output'])
+            keep.add(output)
+            for ext, (_, written) in entry.get('compressed', {}).items():
+                if written:
+                    keep.add(output + ext)
+        for root, dirs, files in os.walk(self.outdir, topdown=False):
+            for fname in files:
+                path = os.path.join(root, fname)
+                if os.path.relpath(path, self.outdir) not in keep:
+                    print('Removing:', path)
+                    os.remove(path)
+            if root != self.outdir and not os.listdir(root):
+                os.rmdir(root)
+
+    def _compress_outputs(self, old_pages, pages):
+        todo = []
+        for path, entry in pages.items():
+            content_type = entry.get('content_type') or \
+                mimetypes.guess_type(entry['output'])[0]
+            if compress.is_compressible(content_type):
+                todo.append((entry, old_pages.get(path, {})))
+
+        def compress_entry(item):
+            entry, old_entry = item
+            path = os.path.join(self.outdir, entry['output'])
+            previous = old_entry.get('compressed', {})
+            fingerprint = recorder.fingerprint_file(path)
+            # Outputs that were not touched since they were last compressed
+            # are not read and hashed again
+            if fingerprint is not None and \
+                    old_entry.get('compressed_fingerprint') == fingerprint and \
+                    _has_compressed(path, previous):
+                return previous, fingerprint
+            return compress.compress_file(path, previous), fingerprint
+
+        # zlib and brotli let go of the GIL while compressing
+        pool = multiprocessing.pool.ThreadPool(self.compress_workers)
+        try:
+            for (entry, _), (result, fingerprint) in \
+                    zip(todo, pool.imap(compress_entry, todo)):
+                entry['compressed'] = result
+                entry['compressed_fingerprint'] = fingerprint
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def run(self):
+        if self.profile is not None:
+            self.profile.start()
+        try:
+            self._run()
+        finally:
+            if self.profile is not None:
+                self.profile.finish()
+
+    def _run(self):
+        # The last manifest is also used to leave outputs (and compressed
+        # copies) that did not change alone
+        if self.incremental or self.skip_unchanged or self.compress:
+            old_pages = self._load_manifest()
+        else:
+            old_pages = {}
+        pages = {}
+
+        def stale_work_items():
+            for i, HandlerClass, path in self._work_items():
+                entry = old_pages.get(path)
+                if self.incremental and entry is not None and \
+                        self._is_fresh(entry):
+                    with self._lock:
+                        pages[path] = entry
+                else:
+                    yield i, HandlerClass, path
+
+        if self.jobs > 1:
+            results = self._render_parallel(stale_work_items())
+        else:
+            results = self._render_serial(stale_work_items())
+
+        self._write_all(results, pages)
+
+        if self.compress:
+            self._compress_outputs(old_pages, pages)
+        if self.skip_unchanged:
+            self._remove_unlisted(pages)
+        else:
+            self._remove_stale(old_pages, pages)
+        self._save_manifest(pages)
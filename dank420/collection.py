@@ -1,10 +1,20 @@
 import lookupy
-from lookupy.dunderkey import dunder_get
+from lookupy.dunderkey import dunder_get, dunder_partition
 import os
-import glob
+import sys
+import mmap
+import pickle
+import threading
+import functools
+import traceback
+import collections
+import multiprocessing
+import multiprocessing.pool
 
 from . import view
 from . import util
+from . import recorder
+from .lookups import compile_lookups
 
 
 class Item():
@@ -37,17 +47,170 @@ class QueryOp():
         '''
         return it
 
+    def apply_to(self, source):
+        '''
+        Apply operator to a collection or view.  Returns an iterator
+
+        Can be overridden to use the indexes of the collection
+        '''
+        return self.apply(iter(source))
+
+
+# Values that hold many values; an item is indexed under each member
+_MULTI_VALUED = (list, tuple, set, frozenset)
+
+_LOOKUPY_OPS = {'exact', 'neq', 'contains', 'icontains', 'in', 'startswith',
+        'istartswith', 'endswith', 'iendswith', 'gt', 'gte', 'lt', 'lte',
+        'regex', 'filter'}
+
+
+def _split_lookup(key):
+    '''
+    Split a lookupy key (eg. `tags__contains`) into the field and operator,
+    the same way lookupy does
+    '''
+    field, op = dunder_partition(key)
+    if op not in _LOOKUPY_OPS:
+        return key, 'exact'
+    return field, op
+
+
+def _group_items(items, field):
+    groups = {}
+    for item in items:
+        value = dunder_get(item, field)
+        values = value if isinstance(value, _MULTI_VALUED) else [value]
+        for v in values:
+            if v is None:
+                continue
+            bucket = groups.setdefault(v, [])
+            if not bucket or bucket[-1] is not item:
+                bucket.append(item)
+    return groups
+
+
+class _FieldIndex():
+    '''
+    A hash index over one field of the items of a collection
+
+    Items are stored by their position in the collection, so that results
+    come out in the same order as a full scan would give them
+    '''
+
+    def __init__(self, items, field):
+        self.items = items
+        self.field = field
+        self._by_value = {}
+        self._by_member = {}
+        self._groups = None
+        # Errors are left for the full scan to raise
+        self._usable = True
+        # `contains` means a substring for str values, so the member index
+        # only answers it if every value is a list or similar
+        self._members_usable = True
+
+        for position, item in enumerate(items):
+            try:
+                value = dunder_get(item, field)
+            except Exception:
+                self._usable = False
+                return
+
+            if isinstance(value, _MULTI_VALUED):
+                for member in value:
+                    try:
+                        bucket = self._by_member.setdefault(member, [])
+                    except TypeError:
+                        self._members_usable = False
+                        continue
+                    if not bucket or bucket[-1] != position:
+                        bucket.append(position)
+            elif value is not None:
+                self._members_usable = False
+
+            try:
+                self._by_value.setdefault(value, []).append(position)
+            except TypeError:
+                # Unhashable values can never equal a hashable one
+                pass
+
+    def positions(self, op, value):
+        '''
+        Returns a set of the positions of the items matching the lookup,
+        or None if the index can not answer it
+        '''
+        if not self._usable:
+            return None
+        try:
+            if op == 'exact':
+                return set(self._by_value.get(value, ()))
+            if op == 'in' and isinstance(value, _MULTI_VALUED):
+                result = set()
+                for v in value:
+                    result.update(self._by_value.get(v, ()))
+                return result
+            if op == 'contains' and isinstance(value, str) \
+                    and self._members_usable:
+                return set(self._by_member.get(value, ()))
+        except TypeError:
+            # Unhashable lookup value
+            return None
+        return None
+
+    def groups(self):
+        if self._groups is None:
+            self._groups = _group_items(self.items, self.field)
+        return self._groups
+
 
 class _FilterQueryOp(QueryOp):
     def __init__(self, *args, **kwargs):
         q1 = list(args) if args else []
         q2 = [lookupy.Q(**kwargs)] if kwargs else []
         self._lookups = q1 + q2
+        self._predicate = compile_lookups(self._lookups)
 
     def apply(self, iterator):
-        predicate = lambda item: all(l.evaluate(item) for l in self._lookups)
+        predicate = self._predicate
         return (x for x in iterator if predicate(x))
 
+    def _indexed_positions(self, root):
+        '''
+        Returns the positions (in the root collection) of the items that
+        could match, using the indexes, or None if they can't be used
+        '''
+        result = None
+        for lookup in self._lookups:
+            # Lookups that are combined with | or ~ can't use the index
+            if not isinstance(lookup, lookupy.Q) or lookup.negate:
+                continue
+            for key, value in lookup.lookups.items():
+                field, op = _split_lookup(key)
+                index = root._get_index(field)
+                if index is None:
+                    continue
+                positions = index.positions(op, value)
+                if positions is None:
+                    continue
+                result = positions if result is None else result & positions
+        return result
+
+    def apply_to(self, source):
+        root = source._root()
+        positions = self._indexed_positions(root)
+        if positions is None:
+            return self.apply(iter(source))
+
+        # The candidates still go through the full filter, for any
+        # lookups the index did not answer
+        items = root._get_indexed_items()
+        if source is root:
+            candidates = iter([items[p] for p in sorted(positions)])
+        else:
+            ids = {id(items[p]) for p in positions}
+            candidates = (x for x in source if id(x) in ids)
+        return self.apply(candidates)
+
 
 class _SortQueryOp(QueryOp):
     def __init__(self, reverse, *args):
@@ -65,10 +228,14 @@ class CollectionView():
     A ""view"" over a collection object.
 
     Implements the filter and other operations;
+
+    The result of the view is worked out once, and kept until the
+    generation of the collection changes.
     '''
     def __init__(self, parent=None, query: QueryOp = None):
         self._parent = parent
         self._query = query
+        self._materialized = None
 
     # This could actually be a bad idea; as some methods of the
     # parent view might iterate over the collection or something
@@ -76,7 +243,13 @@ class CollectionView():
         if self._parent is not None:
             return getattr(self._parent, name)
         else:
-            return super(self).__getattr__(name)
+            raise AttributeError(name)
+
+    def _root(self):
+        '''
+        Returns the Collection at the root of this view
+        '''
+        return self._parent._root()
 
     def all(self):
         '''
@@ -112,11 +285,43 @@ class CollectionView():
         op = _SortQueryOp(reverse, *args)
         return CollectionView(parent=self, query=op)
 
+    def group_by(self, field):
+        '''
+        Group the items of the view by the value of a field.  For fields
+        that hold a list, items are grouped under each member of the list.
+        Items where the value is None are left out.
+
+        If the field is indexed (see `Collection.index_on`), the groups of
+        the whole collection are built once per change of the collection.
+        They must not be modified.
+
+        Args:
+            field (str) - the field to group by
+
+        Returns:
+            dict of value -> list of items, in the order of the view
+        '''
+        # The indexed groups are served without iterating the collection
+        self.record_dependency()
+        root = self._root()
+        if root is self:
+            index = root._get_index(field)
+            if index is not None:
+                return index.groups()
+        return _group_items(self, field)
+
     def __iter__(self):
-        iterator = iter(self._parent)
-        if self._query is not None:
-            iterator = self._query.apply(iterator)
-        return iterator
+        self.record_dependency()
+        generation = self.generation
+        materialized = self._materialized
+        if materialized is None or materialized[0] != generation:
+            if self._query is not None:
+                iterator = self._query.apply_to(self._parent)
+            else:
+                iterator = iter(self._parent)
+            materialized = (generation, list(iterator))
+            self._materialized = materialized
+        return iter(materialized[1])
 
 
 class Collection(CollectionView):
@@ -131,7 +336,86 @@ class Collection(CollectionView):
     A collection could implement the other methods
 
         register_reloader
+
+    Whenever the items in the collection change (eg. in `load`), a
+    subclass must call `mark_changed`.  Views and indexes over the
+    collection use the `generation` to know when to refresh.  Until then,
+    `__iter__` should give back the same item objects.
     '''
+    _parent = None
+    _query = None
+    _generation = 0
+    _index_fields = ()
+    _indexes = None
+
+    def _root(self):
+        return self
+
+    def index_on(self, *fields):
+        '''
+        Keep hash indexes on the given fields.  Filters on an indexed field
+        using `exact` or `in` (or `contains`, for fields that hold lists)
+        are answered from the index rather than checking every item.  So
+        is `group_by` on an indexed field.
+
+        The indexes are rebuilt the first time they are used after the
+        collection changes.
+
+        Args:
+            fields (str) - names of the fields to index
+
+        Returns:
+            the collection, so this can be chained
+
+        Example:
+
+            posts = PostsCollection().index_on('tags', 'category')
+            python_posts = posts.filter(tags__contains='python')
+        '''
+        self._index_fields = self._index_fields + fields
+        self._indexes = None
+        return self
+
+    def _get_indexes(self):
+        generation = self.generation
+        if self._indexes is None or self._indexes[0] != generation:
+            self._indexes = (generation, list(self), {})
+        return self._indexes
+
+    def _get_indexed_items(self):
+        return self._get_indexes()[1]
+
+    def _get_index(self, field):
+        '''
+        Returns the _FieldIndex for a field, or None if it is not indexed
+        '''
+        if field not in self._index_fields:
+            return None
+        _, items, indexes = self._get_indexes()
+        if field not in indexes:
+            indexes[field] = _FieldIndex(items, field)
+        return indexes[field]
+
+    @property
+    def generation(self):
+        '''
+        A counter that is incremented whenever the collection changes
+        '''
+        return self._generation
+
+    def mark_changed(self):
+        '''
+        Record that the items in the collection have changed
+        '''
+        self._generation += 1
+
+    def record_dependency(self):
+        '''
+        Record that the page being rendered depends on this collection
+        (see `dank420.recorder`).  Called whenever the collection, or a
+        view of it, is iterated
+        '''
+        pass
 
     def load(self):
         '''
@@ -158,6 +442,13 @@ class Collection(CollectionView):
 
 
 
+def _describe_item(item):
+    filename = getattr(item, 'filename', None)
+    if filename is not None:
+        return filename
+    return repr(item)
+
+
 class ItemPerPageView(view.View):
     '''
     A view where every page is an item from a collection
@@ -192,11 +483,42 @@ class ItemPerPageView(view.View):
             ValueError if request is insane
         '''
         path = util.normalize_path(request.path)
-        for item in self.collection:
-            ipath = util.normalize_path(self.get_path_for_item(item))
-            if ipath == path:
-                return item
-        raise ValueError(f'Invalid path {path} is not in collection')
+        item = self._get_item_index().get(path)
+        if item is None:
+            raise ValueError(f'Invalid path {path} is not in collection')
+        filename = getattr(item, 'filename', None)
+        if filename is not None:
+            recorder.record_file(filename)
+        return item
+
+    def _get_item_index(self):
+        '''
+        Returns a dict of normalized path -> item, which is cached on the
+        class until the collection changes
+
+        Raises:
+            ValueError if 2 items have the same path
+        '''
+        cls = type(self)
+        generation = self.collection.generation
+        cached = getattr(cls, '_item_index', None)
+        if cached is not None:
+            collection, cached_generation, index = cached
+            if collection is self.collection and cached_generation == generation:
+                return index
+
+        index = {}
+        # Building the index does not make the page depend on every
+        # item in the collection
+        with recorder.paused():
+            for item in self.collection:
+                path = util.normalize_path(self.get_path_for_item(item))
+                if path in index:
+                    raise ValueError('Duplicate path {} for items {} and {}'.format(
+                        path, _describe_item(index[path]), _describe_item(item)))
+                index[path] = item
+        cls._item_index = (self.collection, generation, index)
+        return index
 
     def get_all_paths(self):
         return [self.get_path_for_item(item) for item in self.collection]
@@ -207,6 +529,58 @@ class ItemPerPageView(view.View):
         cls.collection.register_reloader(site)
 
 
+def read_front_matter(fname):
+    '''
+    Read only the front matter header of a file, like:
+
+        ---
+        title: Hello
+        ---
+        The body...
+
+    Returns:
+        tuple of (the header text, byte offset of the body in the file).
+        If there is no front matter, the header is '' and the offset 0
+    '''
+    with open(fname, 'rb') as f:
+        first = f.readline()
+        if first.rstrip() != b'---':
+            return '', 0
+        lines = []
+        for line in f:
+            if line.rstrip() == b'---':
+                return b''.join(lines).decode('utf8'), f.tell()
+            lines.append(line)
+    # Never closed, so it wasn't front matter
+    return '', 0
+
+
+_body_cache_lock = threading.Lock()
+
+
+class _BodyCache():
+    '''
+    A least recently used cache of the bodies of lazy FileCollectionItems
+    '''
+
+    def __init__(self):
+        self._bodies = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, load, max_size):
+        with self._lock:
+            if key in self._bodies:
+                self._bodies.move_to_end(key)
+                return self._bodies[key]
+
+        body = load()
+        with self._lock:
+            self._bodies[key] = body
+            while len(self._bodies) > max_size:
+                self._bodies.popitem(last=False)
+        return body
+
+
 class FileCollectionItem(Item):
     '''
     Customized item for use in a file collection.
@@ -215,14 +589,74 @@ class FileCollectionItem(Item):
 
     Args:
         fname (string): Filename that this object should load and represent
+        body_offset (int or None): if given, `content` is not passed in.
+            Instead it is read from the file (from this byte offset) when
+            it is first used.  See `read_front_matter`
         kwargs (dict): Should pass down to super
 
     Superclasses **must** call `super().__init__(fname, **kwargs)`
+
+    Attributes:
+        max_cached_bodies (int): how many lazily read bodies are kept in
+            memory at once (shared by all items of the class)
+        use_mmap (bool): read lazy bodies through mmap
+        cache_version (int): change this when changing how items are
+            built, so that items from `FileCollection.cache_path` are not
+            reused
+
+    Example of lazy loading:
+
+        class Item(FileCollectionItem):
+            def __init__(self, fname):
+                header, offset = read_front_matter(fname)
+                super().__init__(fname, body_offset=offset,
+                                 **yaml.safe_load(header))
     '''
+    max_cached_bodies = 128
+    use_mmap = False
+    cache_version = 1
 
-    def __init__(self, fname, **kwargs):
+    def __init__(self, fname, body_offset=None, **kwargs):
         super().__init__(**kwargs)
         self.filename = fname
+        self._body_offset = body_offset
+        if body_offset is not None:
+            # So an edited file doesn't get the old body from the cache
+            st = os.stat(fname)
+            self._body_key = (os.path.abspath(fname), body_offset,
+                    st.st_size, st.st_mtime_ns)
+
+    def _read_body(self):
+        with open(self.filename, 'rb') as f:
+            if self.use_mmap and os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    data = m[self._body_offset:]
+            else:
+                f.seek(self._body_offset)
+                data = f.read()
+        return data.decode('utf8')
+
+    def __getattr__(self, name):
+        # Only called when the attribute is not set; so for lazy content
+        offset = self.__dict__.get('_body_offset')
+        if name != 'content' or offset is None:
+            raise AttributeError(name)
+        return self._body_cache().get(
+                self._body_key, self._read_body, self.max_cached_bodies)
+
+    @classmethod
+    def _body_cache(cls):
+        # Looked up in the class's own __dict__, so that each subclass gets
+        # its own cache (sized by its own max_cached_bodies) rather than
+        # sharing its parent's
+        cache = cls.__dict__.get('_bodies')
+        if cache is None:
+            with _body_cache_lock:
+                cache = cls.__dict__.get('_bodies')
+                if cache is None:
+                    cache = _BodyCache()
+                    cls._bodies = cache
+        return cache
 
 
 class FileCollection(Collection):
@@ -230,14 +664,28 @@ class FileCollection(Collection):
     A collection that is backed by files that match the path glob
 
     Attributes:
-        path (str): a glob path to find the files, for example `./posts/**`
+        path (str): a glob path to find the files, for example `./posts/**`.
+            `**` matches any number of directories
         Item (FileCollectionItem superclass): the class for the items
+        load_workers (int or None): if set, `load` constructs the items
+            on a pool of this many workers
+        load_executor (str): 'thread' or 'process'; the kind of pool for
+            `load_workers`.  Processes avoid the GIL for CPU heavy items,
+            but the items must be picklable
+        cache_path (str or None): if set, a file to keep the loaded items
+            in between runs.  Items are reused if their file's size and
+            mtime, and the Item class (see `FileCollectionItem.cache_version`)
+            and the file it is defined in, are unchanged.  Items must be
+            picklable
 
     Note that this collection does not provide any ordering on the items.  It
     can even changes as reloads happen.  You should use the `.sort` function
     to get a sorted view of this collection.
     '''
     Item = FileCollectionItem
+    load_workers = None
+    load_executor = 'thread'
+    cache_path = None
 
     def __init__(self, **kwargs):
         assert issubclass(self.Item, FileCollectionItem)
@@ -245,33 +693,201 @@ class FileCollection(Collection):
 
         super(**kwargs)
         self._items = []
+        self._entries = {}
+        self._pending = set()
+        self._dirty = False
+        self._lock = threading.RLock()
+
+    def _make_pool(self):
+        if self.load_executor == 'thread':
+            return multiprocessing.pool.ThreadPool(self.load_workers)
+        elif self.load_executor == 'process':
+            # Fork, so the workers have the site's Item classes
+            ctx = multiprocessing.get_context('fork')
+            return ctx.Pool(self.load_workers)
+        raise ValueError(f'Unknown load_executor {self.load_executor}')
+
+    def _load_items(self, fnames):
+        '''
+        Returns a list of the items for the files (or None where the file
+        raised DoNotLoadException)
+        '''
+        load_item = functools.partial(_load_item, self.Item)
+        if not (self.load_workers and self.load_workers > 1 and fnames):
+            return [load_item(fname) for fname in fnames]
+
+        pool = self._make_pool()
+        try:
+            chunksize = max(1, len(fnames) // (self.load_workers * 4))
+            items = list(pool.imap(load_item, fnames, chunksize))
+            pool.close()
+        finally:
+            # Stop the rest straight away if an item failed
+            pool.terminate()
+            pool.join()
+        return items
+
+    def _cache_identity(self):
+        Item = self.Item
+        module_file = getattr(sys.modules.get(Item.__module__), '__file__', None)
+        return (Item.__module__, Item.__qualname__, Item.cache_version,
+                module_file and recorder.fingerprint_file(module_file))
+
+    def _read_cache(self):
+        '''
+        Returns a dict of filename -> (stat key, item or None)
+        '''
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            # Corrupt, or the classes in it have gone away
+            return {}
+        if cache.get('identity') != self._cache_identity():
+            return {}
+        return cache['entries']
+
+    def _write_cache(self, entries):
+        dirname = os.path.dirname(self.cache_path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        cache = {'identity': self._cache_identity(), 'entries': entries}
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+
+    def _scan(self):
+        '''
+        Returns a dict of filename -> (size, mtime) for the matching files
+        '''
+        return {path: (st.st_size, st.st_mtime_ns)
+                for path, st in sorted(util.scan_glob(self.path))}
+
+    def _diff(self, scan, previous, force=()):
+        '''
+        Work out the entries (filename -> (stat key, item or None)) for a
+        scan, reusing the previous entries for unchanged files
+
+        Args:
+            scan (dict): from `_scan`
+            previous (dict): the last entries
+            force (set): absolute paths to load again, even if the stat
+                info has not changed
+
+        Returns:
+            tuple of the entries, and if they differ from the previous
+        '''
+        entries = {}
+        to_load = []
+        for fname, stat_key in scan.items():
+            entry = previous.get(fname)
+            if entry is not None and entry[0] == stat_key \
+                    and os.path.abspath(fname) not in force:
+                entries[fname] = entry
+            else:
+                entries[fname] = (stat_key, None)
+                to_load.append(fname)
+
+        for fname, item in zip(to_load, self._load_items(to_load)):
+            entries[fname] = (entries[fname][0], item)
+        changed = bool(to_load) or len(entries) != len(previous)
+        return entries, changed
+
+    def _set_entries(self, entries):
+        self._entries = entries
+        self._items = [item for _, item in entries.values() if item is not None]
+        self.mark_changed()
 
     def load(self):
-        self._items = []
-        for fname in glob.iglob(self.path):
-            try:
-                self._items.append(self.Item(fname))
-            except DoNotLoadException:
-                pass
+        '''
+        Load all the files matching the path
+
+        Raises:
+            ItemLoadError if an item fails to load
+        '''
+        with self._lock:
+            previous = {}
+            if self.cache_path is not None:
+                previous = self._read_cache()
+            entries, changed = self._diff(self._scan(), previous)
+            if self.cache_path is not None and changed:
+                self._write_cache(entries)
+
+            self._pending = set()
+            self._dirty = False
+            self._set_entries(entries)
+
+    def refresh(self):
+        '''
+        Bring the collection up to date with the files on disk, by
+        comparing the size and mtime of every file with the last scan.
+        Only files that were added or changed (or passed to the reloader)
+        are loaded again, and removed files are dropped.
+
+        This is done automatically before the collection is next used
+        after the reloader sees a change, so a batch of changes (eg. from
+        a `git checkout`) is handled in one go.
+
+        Raises:
+            ItemLoadError if an item fails to load
+        '''
+        with self._lock:
+            force = self._pending
+            self._pending = set()
+            self._dirty = False
+            entries, changed = self._diff(self._scan(), self._entries, force)
+            if changed:
+                self._set_entries(entries)
 
     def register_reloader(self, site):
         site.register_reload_callback(self._reload_cb, self.path)
 
     def _reload_cb(self, path):
-        if not os.path.isfile(path):
-            return
+        with self._lock:
+            self._pending.add(os.path.abspath(path))
+            self._dirty = True
 
-        self._items = [i for i in self._items if
-                os.path.abspath(i.filename) != os.path.abspath(path)]
-        try:
-            self._items.append(self.Item(path))
-        except DoNotLoadException:
-            pass
+    @property
+    def generation(self):
+        if self._dirty:
+            self.refresh()
+        return self._generation
+
+    def record_dependency(self):
+        recorder.record_glob(self.path)
 
     def __iter__(self):
+        if self._dirty:
+            self.refresh()
+        self.record_dependency()
         return iter(self._items)
 
 
+def _load_item(Item, fname):
+    '''
+    Returns the item for a file, or None if it raised DoNotLoadException
+    '''
+    try:
+        return Item(fname)
+    except DoNotLoadException:
+        return None
+    except Exception as e:
+        # Formatted here, as the traceback is lost if this came from
+        # another process
+        raise ItemLoadError('Failed to load {}:\n{}'.format(
+            fname, traceback.format_exc())) from e
+
+
+class ItemLoadError(Exception):
+    '''
+    Raised when constructing an item of a FileCollection fails
+    '''
+    pass
+
+
 class DoNotLoadException(Exception):
     '''
     Raise this during the FileCollectionItem construction if you wish for the
@@ -0,0 +1,129 @@
+'''
+Precompressed copies of build outputs (eg. `page/index.html.gz` next to
+`page/index.html`), for servers that can send them as is, like nginx with
+`gzip_static` and `brotli_static`
+
+Brotli copies are only made if the `brotli` module is installed.
+'''
+import os
+import zlib
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller files are not worth compressing
+MIN_SIZE = 256
+# Compressed copies are only kept if they are at most this fraction of the
+# original size
+MAX_RATIO = 0.95
+
+_COMPRESSIBLE_TYPES = {
+    'application/javascript',
+    'application/json',
+    'application/manifest+json',
+    'application/rss+xml',
+    'application/atom+xml',
+    'application/xhtml+xml',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+    'font/ttf',
+    'font/otf',
+}
+
+
+def is_compressible(content_type):
+    '''
+    Returns True if files of the content type are worth compressing
+    '''
+    if not content_type:
+        return False
+    content_type = content_type.split(';')[0].strip()
+    return content_type.startswith('text/') or \
+        content_type in _COMPRESSIBLE_TYPES or \
+        content_type.endswith(('+xml', '+json'))
+
+
+def gzip_compress(data):
+    # wbits=31 writes a gzip header; zlib leaves the timestamp and file
+    # name out of it, so the output only depends on the data
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def brotli_compress(data):
+    return brotli.compress(data)
+
+
+# Every extension of the compressed copies, including ones for modules that
+# are not installed
+EXTENSIONS = ('.gz', '.br')
+
+
+def remove_compressed(path):
+    '''
+    Remove the compressed copies of a file, if there are any
+    '''
+    for ext in EXTENSIONS:
+        try:
+            os.remove(path + ext)
+        except FileNotFoundError:
+            pass
+
+
+def get_encodings():
+    '''
+    Returns a list of (file extension, compress function) for the
+    compressed copies to make
+    '''
+    encodings = [('.gz', gzip_compress)]
+    if brotli is not None:
+        encodings.append(('.br', brotli_compress))
+    return encodings
+
+
+def compress_file(path, previous):
+    '''
+    Write the compressed copies of a file.  Copies made from the same data
+    last time are reused.
+
+    Args:
+        path (str): the file to compress
+        previous (dict): what this returned for the file last time, or {}
+
+    Returns:
+        dict of extension -> [hash of the data, whether the copy was
+        written].  Json serializable, for keeping in the build manifest
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+
+    result = {}
+    for ext, compress in get_encodings():
+        compressed_path = path + ext
+        last = previous.get(ext)
+        if last is not None and last[0] == digest and \
+                (not last[1] or os.path.isfile(compressed_path)):
+            result[ext] = last
+            continue
+
+        written = False
+        if len(data) >= MIN_SIZE:
+            compressed = compress(data)
+            if len(compressed) <= len(data) * MAX_RATIO:
+                # Replaced rather than written into, as it could be a
+                # hard link to the live site
+                tmp_path = '{}.{}.tmp'.format(compressed_path, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp_path, compressed_path)
+                written = True
+        if not written and os.path.isfile(compressed_path):
+            os.remove(compressed_path)
+        result[ext] = [digest, written]
+    return result
@@ -1,4 +1,7 @@
+import os
 import sys
+import fnmatch
+import threading
 import http.server
 from werkzeug import wrappers
 from werkzeug import serving
@@ -6,11 +9,50 @@ from werkzeug.contrib.profiler import ProfilerMiddleware
 
 from .response import force_response, Response
 from .request import Request
+from . import recorder
+from . import util
+
+
+# For paths with a hash of the content in them
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
 
 
 class DevServer():
+    '''
+    Renders the site's pages when they are requested
+
+    Rendered pages are kept in memory until the site's reloader sees a
+    change to one of the files (or collections) they were rendered from.
+
+    Args:
+        site (Site): the site to serve
+    '''
+
     def __init__(self, site):
         self.site = site
+        # normalized path -> (response, absolute file paths, absolute globs)
+        self._cache = {}
+        self._lock = threading.Lock()
+        # Paths that changed while pages were being rendered, so that a
+        # page is not cached if one of its inputs changed during the render.
+        # Cleared when nothing is rendering
+        self._rendering = 0
+        self._changes = []
+        # Every change in the watched directories is passed on, but only
+        # the pages that depend on the changed files are affected
+        site.register_reload_callback(self._files_changed, None, batch=True)
+
+    def _files_changed(self, paths):
+        paths = [os.path.abspath(p) for p in paths]
+        with self._lock:
+            if self._rendering:
+                self._changes.extend(paths)
+            for key, (_, files, globs) in list(self._cache.items()):
+                if any(self._depends_on(p, files, globs) for p in paths):
+                    del self._cache[key]
+
+    def _depends_on(self, path, files, globs):
+        return path in files or any(fnmatch.fnmatch(path, g) for g in globs)
 
     @wrappers.Request.application
     def wsgi_app(self, request):
@@ -19,23 +61,72 @@ class DevServer():
 
         path = request.path
         response, status = self.dispatch(path)
-        return wrappers.Response(
+        wsgi_response = wrappers.Response(
                 response.data,
                 status=status,
                 mimetype=response.content_type)
+        if status != 200:
+            return wsgi_response
+
+        if response.immutable:
+            wsgi_response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            # Browsers check back each time, but only download the page
+            # again if it changed
+            wsgi_response.headers['Cache-Control'] = 'no-cache'
+            wsgi_response.add_etag()
+            wsgi_response.make_conditional(request)
+        return wsgi_response
 
     def dispatch(self, path: str) -> Response:
+        key = util.normalize_path(path)
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None:
+            return cached[0], 200
+
         handler = self.site.router.find(path)
         if handler is None:
             return Response(b'404 no matching handler; use the `paths` subcommand to debug'), 404
-        else:
+
+        with self._lock:
+            self._rendering += 1
+            first_change = len(self._changes)
+        try:
             request = Request(path, self.site)
-            resp = force_response(handler.dispatch(request))
+            with recorder.Recorder() as rec:
+                resp = force_response(handler.dispatch(request))
+        except BaseException:
+            with self._lock:
+                self._finish_render()
+            raise
+        else:
+            files = frozenset(os.path.abspath(f) for f in rec.files)
+            globs = tuple(os.path.abspath(g) for g in rec.globs)
+            # Make sure changes to them are seen
+            for f in files:
+                self.site.watch(os.path.dirname(f))
+            for g in globs:
+                self.site.watch(util.glob_root(g))
+            with self._lock:
+                changed = self._changes[first_change:]
+                if not any(self._depends_on(p, files, globs) for p in changed):
+                    self._cache[key] = (resp, files, globs)
+                self._finish_render()
             return resp, 200
 
+    def _finish_render(self):
+        self._rendering -= 1
+        if not self._rendering:
+            self._changes.clear()
+
 
 def run_dev_server(my_site, host, port, profile=False):
     app = DevServer(my_site).wsgi_app
+    # The reloader runs the server in a child process; only it needs to
+    # watch the site's files
+    if serving.is_running_from_reloader():
+        my_site.start_watching()
 
     if profile:
         app = ProfilerMiddleware(app)
@@ -0,0 +1,158 @@
+'''
+Compiles lookupy lookups (`Q` objects) into plain python functions
+
+lookupy works out what each lookup means (splitting the key, picking the
+operator) every time it checks an item.  The functions made here do that
+once, and then behave the same as lookupy's `evaluate`.  Anything that is
+not handled here falls back to lookupy.
+'''
+import re
+from lookupy.lookupy import LookupLeaf, LookupNode, lookup
+from lookupy.dunderkey import dunder_partition
+
+
+def _make_getter(key):
+    '''
+    Same as `lookupy.dunderkey.dunder_get(item, key)`
+    '''
+    parts = key.split('__')
+    if len(parts) == 1:
+        def get(item):
+            try:
+                return item[key]
+            except KeyError:
+                return None
+        return get
+
+    def get(item):
+        for part in parts:
+            try:
+                item = item[part]
+            except KeyError:
+                return None
+        return item
+    return get
+
+
+def _not_none(get, fn):
+    def predicate(item):
+        value = get(item)
+        return False if value is None else fn(value)
+    return predicate
+
+
+def _compile_pair(key, val):
+    '''
+    Returns a function that is the same as `lookupy.lookupy.lookup(key, val,
+    item)`, or None if it should be left to lookupy
+    '''
+    init, last = dunder_partition(key)
+
+    # lookupy raises errors for bad values when checking each item; so
+    # leave those to it
+    needs_str = last in {'contains', 'icontains', 'startswith',
+            'istartswith', 'endswith', 'iendswith'}
+    if needs_str and not isinstance(val, str):
+        return None
+
+    get = _make_getter(init) if last is not None else None
+    if last == 'exact':
+        return lambda item: get(item) == val
+    elif last == 'neq':
+        return lambda item: get(item) != val
+    elif last == 'contains':
+        return _not_none(get, lambda y: val in y)
+    elif last == 'icontains':
+        lower = val.lower()
+        return _not_none(get, lambda y: lower in y.lower())
+    elif last == 'in':
+        try:
+            iter(val)
+        except TypeError:
+            return None
+        return lambda item: get(item) in val
+    elif last == 'startswith':
+        return _not_none(get, lambda y: y.startswith(val))
+    elif last == 'istartswith':
+        lower = val.lower()
+        return _not_none(get, lambda y: y.lower().startswith(lower))
+    elif last == 'endswith':
+        return _not_none(get, lambda y: y.endswith(val))
+    elif last == 'iendswith':
+        lower = val.lower()
+        return _not_none(get, lambda y: y.lower().endswith(lower))
+    elif last == 'gt':
+        return _not_none(get, lambda y: y > val)
+    elif last == 'gte':
+        return _not_none(get, lambda y: y >= val)
+    elif last == 'lt':
+        return _not_none(get, lambda y: y < val)
+    elif last == 'lte':
+        return _not_none(get, lambda y: y <= val)
+    elif last == 'regex':
+        try:
+            regex = re.compile(val)
+        except (TypeError, re.error):
+            return None
+        return _not_none(get, lambda y: regex.search(y) is not None)
+    elif last == 'filter':
+        return None
+    else:
+        get = _make_getter(key)
+        return lambda item: get(item) == val
+
+
+def _compile_leaf(leaf):
+    predicates = []
+    for key, val in leaf.lookups.items():
+        predicate = _compile_pair(key, val)
+        if predicate is None:
+            predicate = (lambda key, val:
+                    lambda item: lookup(key, val, item))(key, val)
+        predicates.append(predicate)
+
+    if len(predicates) == 1:
+        predicate = predicates[0]
+    else:
+        predicate = lambda item: all(p(item) for p in predicates)
+    if leaf.negate:
+        return lambda item: not predicate(item)
+    return predicate
+
+
+def _compile_node(node):
+    children = [compile_lookup(child) for child in node.children]
+    combine = any if node.op == 'or' else all
+    if node.negate:
+        return lambda item: not combine(c(item) for c in children)
+    return lambda item: combine(c(item) for c in children)
+
+
+def compile_lookup(lookup_):
+    '''
+    Compile a lookupy `Q` object (or a tree of them joined with & | ~)
+
+    Args:
+        lookup_ - the lookup; anything with an `evaluate(item)` method
+
+    Returns:
+        function(item) -> bool, same as `lookup_.evaluate`
+    '''
+    if type(lookup_) is LookupLeaf:
+        return _compile_leaf(lookup_)
+    if type(lookup_) is LookupNode:
+        return _compile_node(lookup_)
+    return lookup_.evaluate
+
+
+def compile_lookups(lookups):
+    '''
+    Compile a list of lookups that must all match
+
+    Returns:
+        function(item) -> bool
+    '''
+    predicates = [compile_lookup(l) for l in lookups]
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda item: all(p(item) for p in predicates)
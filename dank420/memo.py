@@ -0,0 +1,142 @@
+'''
+Memoization of expensive item properties (eg. rendering markdown)
+
+Values are keyed by a hash of the property's source (eg. the `content` of
+an item) and a version, so an item that is loaded again with the same
+content reuses the value, and only edited items are rendered again.
+'''
+import os
+import pickle
+import hashlib
+import threading
+import functools
+import collections
+
+_MISSING = object()
+
+
+class MemoryStore():
+    '''
+    An in memory least recently used store of values
+
+    Args:
+        max_entries (int): how many values to keep
+    '''
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._values = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        Returns the value, or `_MISSING`
+        '''
+        with self._lock:
+            value = self._values.get(key, _MISSING)
+            if value is not _MISSING:
+                self._values.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.max_entries:
+                self._values.popitem(last=False)
+
+
+class DiskStore():
+    '''
+    A store that keeps pickled values in a directory, so they are kept
+    between runs (and shared by build workers)
+
+    Args:
+        path (str): directory for the values
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file_for(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key):
+        try:
+            with open(self._file_for(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return _MISSING
+        except Exception:
+            # Corrupt; it will be written again
+            return _MISSING
+
+    def set(self, key, value):
+        fname = self._file_for(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp_fname = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fname, fname)
+
+
+_memory_store = MemoryStore()
+
+
+def _hash_source(name, version, source):
+    hasher = hashlib.sha256()
+    hasher.update(f'{name}:{version}\0'.encode('utf8'))
+    if isinstance(source, bytes):
+        hasher.update(source)
+    elif isinstance(source, str):
+        hasher.update(source.encode('utf8'))
+    else:
+        hasher.update(repr(source).encode('utf8'))
+    return hasher.hexdigest()
+
+
+def memoized_property(source, version=1, store=None):
+    '''
+    Decorator for a property that is only computed once per distinct value
+    of the `source` attribute.  Values are kept in memory, and in `store`
+    if it is given.
+
+    Args:
+        source (str): name of the attribute the property is computed from
+        version: change this when changing how the value is computed (eg.
+            when changing the markdown extensions), so old values are not
+            reused
+        store (DiskStore or None): a persistent store to use as well
+
+    Example:
+
+        class Item(FileCollectionItem):
+            @memo.memoized_property('content', version=2,
+                                    store=memo.DiskStore('.cache/html'))
+            def html(self):
+                return markdown_ctx.convert(self.content)
+    '''
+    def decorator(fn):
+        name = f'{fn.__module__}.{fn.__qualname__}'
+
+        @functools.wraps(fn)
+        def getter(self):
+            key = _hash_source(name, version, getattr(self, source))
+
+            value = _memory_store.get(key)
+            if value is not _MISSING:
+                return value
+            if store is not None:
+                value = store.get(key)
+                if value is not _MISSING:
+                    _memory_store.set(key, value)
+                    return value
+
+            value = fn(self)
+            _memory_store.set(key, value)
+            if store is not None:
+                store.set(key, value)
+            return value
+
+        return property(getter)
+    return decorator
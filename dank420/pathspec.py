@@ -1,5 +1,23 @@
 import re
 
+_variable_re = re.compile(r'<(?P<mod>\*?)(?P<name>[a-zA-Z_]\w+)>')
+
+
+def _to_regex(pathspec, group_prefix=''):
+    '''
+    Returns the regex (without anchors) for a pathspec string, with the
+    variables' group names prefixed by group_prefix
+    '''
+    def repl(match):
+        name = group_prefix + match.group('name')
+        mod = match.group('mod')
+        if '*' in mod:
+            return '(?P<'+name+'>.+)'
+        else:
+            return '(?P<'+name+'>[^/]+)'
+    return _variable_re.sub(repl, pathspec)
+
+
 class Pathspec():
     '''
     Pathspec: a class to manage patterns for matching and creating paths
@@ -16,23 +34,14 @@ class Pathspec():
     '''
 
     def __init__(self, pathspec):
-        variable_re = r'<(?P<mod>\*?)(?P<name>[a-zA-Z_]\w+)>'
-        def repl(match):
-            name = match.group('name')
-            mod = match.group('mod')
-            if '*' in mod:
-                return '(?P<'+name+'>.+)'
-            else:
-                return '(?P<'+name+'>[^/]+)'
-
-        regex = re.sub(variable_re, repl, pathspec)
-        regex = '^' + regex + '$'
-        self._regex = re.compile(regex)
+        self._pathspec = pathspec
+        self._names = [m.group('name') for m in _variable_re.finditer(pathspec)]
+        self._regex = re.compile('^' + _to_regex(pathspec) + '$')
 
         def repl(match):
             name = match.group('name')
             return '{'+name+'}'
-        self._format = re.sub(variable_re, repl, pathspec)
+        self._format = _variable_re.sub(repl, pathspec)
 
     def match(self, path):
         '''
@@ -56,3 +65,86 @@ class Pathspec():
         return self._format.format(**kwargs)
 
 
+class PathspecSet():
+    '''
+    Many Pathspecs compiled into a single regex, so that a path is matched
+    against all of them in one go
+
+    Like the Router, the first added Pathspec that matches wins.
+
+    Example:
+
+        specs = PathspecSet()
+        specs.add(Pathspec('/blog/<post>'), BlogView)
+        specs.add(Pathspec('/static/<*name>'), StaticView)
+        specs.match('/blog/hello')  # (BlogView, {'post': 'hello'})
+    '''
+
+    def __init__(self):
+        # list of (pathspec, value)
+        self._specs = []
+        self._regex = None
+
+    def __len__(self):
+        return len(self._specs)
+
+    def add(self, pathspec, value=None):
+        '''
+        Add a Pathspec to the set
+
+        Args:
+            pathspec (Pathspec): the pathspec
+            value: returned when the pathspec matches; defaults to the
+                pathspec itself
+        '''
+        self._specs.append((pathspec, pathspec if value is None else value))
+        self._regex = None
+
+    def _get_regex(self):
+        if self._regex is None:
+            # Each pathspec's groups are renamed, so they don't clash, and
+            # it is wrapped in a group saying which one matched.  That
+            # group closes last, so it is the match's `lastgroup`
+            alternatives = []
+            for i, (pathspec, _) in enumerate(self._specs):
+                alternatives.append('(?P<_{0}>{1})$'.format(
+                    i, _to_regex(pathspec._pathspec, '_{}_'.format(i))))
+            self._regex = re.compile('^(?:' + '|'.join(alternatives) + ')')
+        return self._regex
+
+    def _groupdict(self, i, match):
+        return {name: match.group('_{}_{}'.format(i, name))
+                for name in self._specs[i][0]._names}
+
+    def match(self, path):
+        '''
+        Match a path against the pathspecs
+
+        Returns:
+            tuple of the value of the first matching pathspec, and its
+            dict of name->value pairs (str->str); or None if none match
+        '''
+        if not self._specs:
+            return None
+        match = self._get_regex().match(path)
+        if match is None:
+            return None
+        i = int(match.lastgroup[1:])
+        return self._specs[i][1], self._groupdict(i, match)
+
+    def match_all(self, path):
+        '''
+        Like `match`, but yields every matching pathspec in order.  The
+        first is found in one go; the rest are tried one by one
+        '''
+        if not self._specs:
+            return
+        match = self._get_regex().match(path)
+        if match is None:
+            return
+        first = int(match.lastgroup[1:])
+        yield self._specs[first][1], self._groupdict(first, match)
+        for pathspec, value in self._specs[first + 1:]:
+            groups = pathspec.match(path)
+            if groups is not None:
+                yield value, groups
@@ -0,0 +1,198 @@
+'''
+Timings of where a build spends its time, for `build --profile-report`
+
+Pages are timed in these stages:
+
+* dispatch - the view's `dispatch` (which includes rendering templates)
+* template - rendering templates with `Templates.render`
+* write - writing the output file
+
+Along with the time each handler spends in `get_all_paths`.
+'''
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+import contextlib
+import collections
+
+STAGES = ('dispatch', 'template', 'write')
+
+_local = threading.local()
+
+
+class Timings():
+    '''
+    Collects the time spent in each stage while rendering a page.  Use it
+    as a context manager around the render.
+
+    Attributes:
+        seconds (dict of str -> float): time spent in each stage
+    '''
+
+    def __init__(self):
+        self.seconds = collections.defaultdict(float)
+        self._active = set()
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'timings', None)
+        _local.timings = self
+        return self
+
+    def __exit__(self, *exc):
+        _local.timings = self._previous
+        self._previous = None
+
+
+@contextlib.contextmanager
+def timed(stage):
+    '''
+    Add the time spent in this block to the current page's timings, if a
+    page is being timed.  Nested blocks of the same stage (eg. a template
+    rendering another template) are only counted once.
+    '''
+    timings = getattr(_local, 'timings', None)
+    if timings is None or stage in timings._active:
+        yield
+        return
+
+    timings._active.add(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.seconds[stage] += time.perf_counter() - start
+        timings._active.discard(stage)
+
+
+def _handler_name(HandlerClass):
+    return f'{HandlerClass.__module__}.{HandlerClass.__qualname__}'
+
+
+def _empty_totals():
+    totals = {stage: 0.0 for stage in STAGES}
+    totals['get_all_paths'] = 0.0
+    totals['paths'] = 0
+    totals['bytes_written'] = 0
+    return totals
+
+
+class BuildProfile():
+    '''
+    Collects the timings of a build, to write out as a json report
+
+    Example:
+
+        profile = BuildProfile(slowest=10)
+        site.build('out', profile=profile)
+        profile.save('profile.json')
+
+    Args:
+        slowest (int): how many of the slowest paths to list in the report
+        cprofile_path (str or None): also run cProfile over the build, and
+            dump its stats to this file.  Only covers the main process, so
+            it is most useful with jobs=1
+        trace_memory (bool): also trace memory allocations with
+            tracemalloc, adding the top allocation sites to the report
+    '''
+
+    def __init__(self, slowest=20, cprofile_path=None, trace_memory=False):
+        self.slowest = slowest
+        self.cprofile_path = cprofile_path
+        self.trace_memory = trace_memory
+
+        # handler name -> totals
+        self.handlers = {}
+        # path -> timings of the path
+        self.paths = {}
+        self.total_seconds = None
+        self.memory = None
+
+        self._start = None
+        self._cprofile = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.cprofile_path is not None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def finish(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.memory = {
+                'peak_bytes': peak,
+                'top': [
+                    {'where': str(stat.traceback), 'bytes': stat.size,
+                     'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.slowest]
+                ],
+            }
+        self.total_seconds = time.perf_counter() - self._start
+
+    def _totals_for(self, HandlerClass):
+        name = _handler_name(HandlerClass)
+        if name not in self.handlers:
+            self.handlers[name] = _empty_totals()
+        return name, self.handlers[name]
+
+    def add_get_all_paths(self, HandlerClass, seconds):
+        _, totals = self._totals_for(HandlerClass)
+        totals['get_all_paths'] += seconds
+
+    def add_path(self, path, HandlerClass, seconds, bytes_written):
+        '''
+        Args:
+            path (str): the path that was built
+            HandlerClass: the view that rendered it
+            seconds (dict of str -> float): time spent in each stage
+            bytes_written (int): size of the output, or 0 if it was not
+                written (eg. it was unchanged)
+        '''
+        name, totals = self._totals_for(HandlerClass)
+        entry = {'handler': name, 'bytes_written': bytes_written}
+        for stage in STAGES:
+            entry[stage] = seconds.get(stage, 0.0)
+            totals[stage] += entry[stage]
+        # Templates are rendered within dispatch
+        entry['total'] = entry['dispatch'] + entry['write']
+        totals['paths'] += 1
+        totals['bytes_written'] += bytes_written
+        self.paths[path] = entry
+
+    def report(self):
+        '''
+        Returns the report as a json serializable dict
+        '''
+        totals = _empty_totals()
+        for handler_totals in self.handlers.values():
+            for key in totals:
+                totals[key] += handler_totals[key]
+
+        slowest = sorted(self.paths.items(),
+                         key=lambda item: item[1]['total'], reverse=True)
+        report = {
+            'total_seconds': self.total_seconds,
+            'totals': totals,
+            'handlers': self.handlers,
+            'slowest_paths': [dict(entry, path=path)
+                              for path, entry in slowest[:self.slowest]],
+            'paths': self.paths,
+        }
+        if self.memory is not None:
+            report['memory'] = self.memory
+        return report
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
@@ -0,0 +1,102 @@
+import os
+import hashlib
+import threading
+import contextlib
+
+from .util import scan_glob
+
+_local = threading.local()
+
+
+class Recorder():
+    '''
+    Records the inputs (files and collection globs) that are touched while
+    rendering a page.  Use it as a context manager around the render.
+
+    Views normally do not need to use this directly; the template,
+    collection and static file helpers record what they read.
+
+    Attributes:
+        files (set of str): paths of files that were read
+        globs (set of str): glob patterns of collections that were iterated
+    '''
+
+    def __init__(self):
+        self.files = set()
+        self.globs = set()
+
+    def __enter__(self):
+        _stack().append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _stack().pop()
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _current():
+    stack = _stack()
+    if stack and stack[-1] is not None:
+        return stack[-1]
+    return None
+
+
+def record_file(path):
+    '''
+    Record that the current page depends on the file at `path`
+    '''
+    recorder = _current()
+    if recorder is not None:
+        recorder.files.add(os.path.normpath(path))
+
+
+def record_glob(pattern):
+    '''
+    Record that the current page depends on every file matching `pattern`,
+    and on the set of files that match it
+    '''
+    recorder = _current()
+    if recorder is not None:
+        recorder.globs.add(pattern)
+
+
+@contextlib.contextmanager
+def paused():
+    '''
+    Stop recording inside this block; for when the framework looks things
+    up in a way that should not count as a dependency
+    '''
+    stack = _stack()
+    stack.append(None)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def fingerprint_file(path):
+    '''
+    Returns a cheap fingerprint (json serializable) of a file, or None if
+    it does not exist
+    '''
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def fingerprint_glob(pattern):
+    '''
+    Returns a fingerprint of the files matching a glob and their contents
+    '''
+    hasher = hashlib.sha1()
+    for path, st in sorted(scan_glob(pattern)):
+        fingerprint = [st.st_size, st.st_mtime_ns]
+        hasher.update(repr((path, fingerprint)).encode('utf8'))
+    return hasher.hexdigest()
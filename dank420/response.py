@@ -34,12 +34,16 @@ class Response():
     Attributes:
         data (bytes): the content of the response
         content_type (str): advisory content type value
+        immutable (bool): the content at this path never changes (eg. it
+            has a hash of the content in the path), so the development
+            server lets browsers cache it forever
     '''
-    def __init__(self, data, content_type='text/html'):
+    def __init__(self, data, content_type='text/html', immutable=False):
         if not isinstance(data, bytes):
             raise ValueError(f'Data must be bytes; got {data}')
         self.data = data
         self.content_type = content_type
+        self.immutable = immutable
 
     @property
     def is_html(self):
@@ -49,3 +53,25 @@ class Response():
         return self.content_type == 'text/html'
 
 
+class FileResponse(Response):
+    '''
+    A response with the content of a file on disk
+
+    The file is only read if `data` is used (eg. by the development
+    server).  When building, it is copied straight to the output, without
+    the data going through python.
+
+    Attributes:
+        path (str): the file to respond with
+        content_type (str): advisory content type value
+        immutable (bool): see `Response`
+    '''
+    def __init__(self, path, content_type='text/html', immutable=False):
+        self.path = path
+        self.content_type = content_type
+        self.immutable = immutable
+
+    @property
+    def data(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
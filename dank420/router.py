@@ -1,25 +1,88 @@
+import heapq
+
 from .util import normalize_path
+from .pathspec import PathspecSet
 
 class Router():
     '''
     Router: manages the paths
 
     Probably not a public API
+
+    Paths are looked up in a table of every path listed by the handlers,
+    which is built on the first `find` and rebuilt after `invalidate`.
+    Handlers that set `enumerate_paths = False` are not listed in the
+    table, and are asked through `does_include_path` instead (only for
+    paths matching their `pathspec`, if they have one; those are matched
+    in one go with a `PathspecSet`).  Either way, the first registered
+    handler that includes a path wins.
     '''
 
     def __init__(self):
         self._all = []
+        self._table = None
+        self._version = 0
 
     def add(self, handler_class):
         self._all.append(handler_class)
+        self.invalidate()
+
+    def invalidate(self):
+        '''
+        Forget the route table, as the paths of some handler have changed.
+        It is rebuilt on the next `find`
+        '''
+        self._version += 1
+        self._table = None
+
+    def _build_table(self):
+        index = {}
+        # Fallbacks without a pathspec, which are asked about every path
+        fallbacks = []
+        pathspecs = PathspecSet()
+        for position, HandlerClass in enumerate(self._all):
+            paths = None
+            if HandlerClass.enumerate_paths:
+                paths = HandlerClass().get_all_paths()
+            if paths is None:
+                if HandlerClass.pathspec is not None:
+                    pathspecs.add(HandlerClass.pathspec,
+                                  (position, HandlerClass))
+                else:
+                    fallbacks.append((position, HandlerClass))
+                continue
+            for path in paths:
+                index.setdefault(normalize_path(path), (position, HandlerClass))
+        return index, fallbacks, pathspecs
+
+    def _get_table(self):
+        table = self._table
+        if table is None:
+            version = self._version
+            table = self._build_table()
+            # Do not keep the table if it was invalidated while building
+            if version == self._version:
+                self._table = table
+        return table
 
     def find(self, path):
         path = normalize_path(path)
-        for HandlerClass in self._all:
-            handler = HandlerClass()
+        index, fallbacks, pathspecs = self._get_table()
+        position, HandlerClass = index.get(path, (len(self._all), None))
+
+        # Handlers that are not in the table still win if they were
+        # registered first
+        matched = (value for value, _ in pathspecs.match_all(path))
+        for fallback_position, FallbackClass in heapq.merge(fallbacks, matched):
+            if fallback_position > position:
+                break
+            handler = FallbackClass()
             if handler.does_include_path(path):
                 return handler
-        return None
+
+        if HandlerClass is None:
+            return None
+        return HandlerClass()
 
     def print_debug(self):
         print('Listing all paths:')
@@ -34,4 +97,3 @@ class Router():
         for HandlerClass in self._all:
             yield HandlerClass
 
-
@@ -1,11 +1,14 @@
 import os
+import json
+import atexit
 import hashlib
 import glob
 import mimetypes
 
 from .pathspec import Pathspec
 from .view import View
-from .response import Response
+from .response import Response, FileResponse
+from . import recorder
 
 def _files_under(base):
     first_root = None
@@ -24,6 +27,78 @@ def _get_hash(data):
     return 'H' + hasher.hexdigest()
 
 
+class _HashCache():
+    '''
+    A cache of file hashes, keyed on the file's size and mtime.  Repeat
+    lookups of an unchanged file only cost an `os.stat`.
+
+    Hashes are also keyed on the `read_path` function used, so views
+    that transform their files (eg. compiling SCSS) do not share hashes
+    with ones that serve the raw file.
+
+    Args:
+        persist_path (str or None): json file to load the cache from, and
+            save it to when the process exits
+    '''
+
+    def __init__(self, persist_path=None):
+        self._hashes = {}
+        self._persist_path = persist_path
+        self._dirty = False
+        if persist_path is not None:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self._persist_path) as f:
+                self._hashes = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._hashes = {}
+
+    def save(self):
+        if self._persist_path is None or not self._dirty:
+            return
+        dirname = os.path.dirname(self._persist_path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(self._persist_path, 'w') as f:
+            json.dump(self._hashes, f)
+        self._dirty = False
+
+    def get(self, reader, path, compute):
+        '''
+        Get the hash of a file, calling `compute()` if it is not cached
+
+        Args:
+            reader (str): name of the function used to read the file
+            path (str): file path
+            compute (function): returns the hash of the file
+
+        Raises:
+            FileNotFoundError if the path does not exist
+        '''
+        st = os.stat(path)
+        by_path = self._hashes.setdefault(reader, {})
+        key = os.path.abspath(path)
+        cached = by_path.get(key)
+        if cached is not None and cached[:2] == [st.st_size, st.st_mtime_ns]:
+            return cached[2]
+
+        hash_ = compute()
+        by_path[key] = [st.st_size, st.st_mtime_ns, hash_]
+        self._dirty = True
+        return hash_
+
+
+_hash_caches = {}
+
+def _get_hash_cache(persist_path):
+    if persist_path not in _hash_caches:
+        _hash_caches[persist_path] = _HashCache(persist_path)
+    return _hash_caches[persist_path]
+
+
 def _is_hash(part):
     return len(part) == 65 and part[0] == 'H'
 
@@ -46,6 +121,62 @@ def _extract_hash(name):
     return os.path.join(dirname, '.'.join(basename)), hashes[0]
 
 
+class Transform():
+    '''
+    A transformation of static files, for example compiling SCSS to CSS
+
+    The output is worked out once, and reused for hashing, routing and
+    serving the file until the file or any of its dependencies change.
+
+    Example:
+
+        class ScssTransform(Transform):
+            extensions = ('.scss',)
+            content_type = 'text/css'
+
+            def apply(self, path):
+                return scss.compiler.compile_file(path).encode()
+
+            def get_dependencies(self, path):
+                return find_imports(path)
+
+    Attributes:
+
+        extensions (tuple of str): file extensions to transform
+        content_type (str or None): content type of the output, if it
+            should not be guessed from the file name
+    '''
+    extensions = ()
+    content_type = None
+
+    def matches(self, path: str) -> bool:
+        '''
+        Returns True if the transform applies to the given file
+        '''
+        return path.endswith(tuple(self.extensions))
+
+    def apply(self, path: str) -> bytes:
+        '''
+        Returns the transformed content of the given file
+        '''
+        raise NotImplementedError('Transform subclass must implement apply')
+
+    def get_dependencies(self, path: str) -> list:
+        '''
+        Returns a list of the other files that the output of `apply` for
+        the given file depends on (eg. imported files)
+        '''
+        return []
+
+
+# (transform, absolute path) -> (dependencies, fingerprints, data, hash)
+_transform_cache = {}
+
+
+def _fingerprint_all(paths):
+    return [recorder.fingerprint_file(p) for p in paths]
+
+
 class StaticView(View):
     '''
     A generic View for serving static files from a directory.  Static files
@@ -72,20 +203,65 @@ class StaticView(View):
             which the static files will be loaded from
         pathspec (Pathspec): a pathspec for where they should be
             served.  Must have a variable `<*name>`, being the file name
+        hash_cache_path (str or None): a json file to keep the file hashes
+            in between runs.  If None, they are only cached in memory.
+            Not used when `read_path` is overridden
+        transforms (list of Transform): transformations to apply to the
+            files that they match
     '''
     template_filter_name = 'static_url'
     base = 'static'
     pathspec = Pathspec('/static/<*name>')
+    hash_cache_path = None
+    transforms = ()
+    # Any change to a static file changes its path; so don't list them
+    enumerate_paths = False
 
     def read_path(self, path: str) -> bytes:
         '''
         Read a given file path, returning the data as bytes
 
-        Can be overridden to transform the data
+        Applies the matching transform, if any.  Can be overridden to
+        transform the data, although `transforms` are cached better;
+        files read by an override are hashed again on every lookup
         '''
+        transform = self._get_transform(path)
+        if transform is not None:
+            return self._transformed(transform, path)[0]
         with open(path, 'rb') as f:
             return f.read()
 
+    def _get_transform(self, path):
+        for transform in self.transforms:
+            if transform.matches(path):
+                return transform
+        return None
+
+    def _transformed(self, transform, path):
+        '''
+        Returns a tuple of the transformed data, its hash, and the files it
+        was made from.  Only runs the transform if one of those changed
+
+        Raises:
+            FileNotFoundError if the path does not exist
+        '''
+        key = (transform, os.path.abspath(path))
+        cached = _transform_cache.get(key)
+        if cached is not None:
+            deps, fingerprints, data, hash_ = cached
+            if _fingerprint_all(deps) == fingerprints:
+                return data, hash_, deps
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        deps = [path] + [d for d in transform.get_dependencies(path) if d != path]
+        # Fingerprinted first, so a change made while transforming is seen
+        fingerprints = _fingerprint_all(deps)
+        data = transform.apply(path)
+        hash_ = _get_hash(data)
+        _transform_cache[key] = (deps, fingerprints, data, hash_)
+        return data, hash_, deps
+
     def get_content_type(self, path: str) -> str:
         '''
         Get the content type of a given path
@@ -99,7 +275,9 @@ class StaticView(View):
 
     @classmethod
     def on_registered(cls, site):
-        site.templates.register_filter(cls.template_filter_name, cls.filename_to_path)
+        # Volatile, as the hash changes when the file does
+        site.templates.register_filter(
+            cls.template_filter_name, cls.filename_to_path, volatile=True)
 
     @classmethod
     def filename_to_path(cls, filename: str) -> str:
@@ -117,11 +295,40 @@ class StaticView(View):
         name = self.pathspec.match(request.path)['name']
         path, hash_ = _extract_hash(name)
         fp = os.path.join(self.base, path)
+        recorder.record_file(fp)
+
+        transform = self._get_transform(fp)
+        if transform is None and type(self).read_path is StaticView.read_path:
+            # Served as is, so let the build copy the file directly
+            return FileResponse(fp,
+                    content_type=self.get_content_type(request.path),
+                    immutable=True)
+
         data = self.read_path(fp)
-        return Response(data, content_type=self.get_content_type(request.path))
+        content_type = None
+        if transform is not None:
+            content_type = transform.content_type
+        content_type = content_type or self.get_content_type(request.path)
+        # The path has the hash of the content in it
+        return Response(data, content_type=content_type, immutable=True)
 
     def _hash_fp(self, fp):
-        return _get_hash(self.read_path(fp))
+        transform = self._get_transform(fp)
+        if transform is not None:
+            data, hash_, deps = self._transformed(transform, fp)
+            for dep in deps:
+                recorder.record_file(dep)
+            return hash_
+
+        recorder.record_file(fp)
+        read_path = type(self).read_path
+        if read_path is not StaticView.read_path:
+            # An override can depend on other files, or change with the
+            # code, neither of which the file's stat would show
+            return _get_hash(self.read_path(fp))
+        reader = f'{read_path.__module__}.{read_path.__qualname__}'
+        cache = _get_hash_cache(self.hash_cache_path)
+        return cache.get(reader, fp, lambda: _get_hash(self.read_path(fp)))
 
     def get_all_paths(self):
         files = (_files_under(self.base))
@@ -137,9 +344,7 @@ class StaticView(View):
         path, hash_ = _extract_hash(name)
 
         try:
-            data = self.read_path(os.path.join(self.base, path))
+            real_hash = self._hash_fp(os.path.join(self.base, path))
         except FileNotFoundError:
             return False
-
-        real_hash = _get_hash(data)
-        return real_hash  == hash_
+        return real_hash == hash_
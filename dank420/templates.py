@@ -1,6 +1,31 @@
+import os
 import jinja2
 
 from . import static
+from . import recorder
+from . import profiling
+
+# Renamed in jinja2 3.0
+_pass_context = getattr(jinja2, 'pass_context', None) or jinja2.contextfilter
+
+
+class _Environment(jinja2.Environment):
+    '''
+    An environment that records every template file loaded while rendering
+    a page, including ones pulled in by `extends` and `include`
+    '''
+
+    def get_template(self, *args, **kwargs):
+        template = super().get_template(*args, **kwargs)
+        if template.filename:
+            recorder.record_file(template.filename)
+        return template
+
+    def select_template(self, *args, **kwargs):
+        template = super().select_template(*args, **kwargs)
+        if template.filename:
+            recorder.record_file(template.filename)
+        return template
 
 
 class Templates():
@@ -8,25 +33,60 @@ class Templates():
     A class that manages the template environment
     for a given site
 
+    Compiled templates are cached, and the cache is cleared when the
+    site's reloader sees a template change.
+
+    Args:
+
+    * site: the Site
+    * bytecode_cache_dir (str or None): directory to keep compiled
+      templates in between runs
+
     Attributes:
 
     * environment: a jinja2.Environment
     '''
 
-    def __init__(self, site):
+    path = './templates'
+
+    def __init__(self, site, bytecode_cache_dir=None):
         self._site = site
-        self.environment = jinja2.Environment(
-            loader=jinja2.FileSystemLoader('./templates'))
-        # Disable cache as it caches results of the StaticView's
-        # template filter.  This results in files not loading,
-        # as they have outdated hashes.
-        # FIXME: re-enable the cache
-        self.environment.cache = None
+
+        bytecode_cache = None
+        if bytecode_cache_dir is not None:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_cache_dir)
+
+        # Templates are reloaded through `_reload_cb` rather than
+        # checking the mtime every time they are used
+        self.environment = _Environment(
+            loader=jinja2.FileSystemLoader(self.path),
+            auto_reload=False,
+            bytecode_cache=bytecode_cache)
 
     def _get_globals(self):
         return {}
 
-    def register_filter(self, name, fn):
+    def _reload_cb(self, path):
+        # Templates include each other, so drop all of them
+        self.environment.cache.clear()
+
+    def register_filter(self, name, fn, volatile=False):
+        '''
+        Add a filter to the template environment
+
+        Args:
+            name (str): name to use the filter by in templates
+            fn (function): the filter
+            volatile (bool): if True, the filter is always called when
+                rendering.  Otherwise jinja2 may call it once when compiling
+                a template (eg. for `{{ "main.css" | static_url }}`), and
+                keep that result while the template is cached
+        '''
+        if volatile:
+            wrapped = fn
+            fn = _pass_context(lambda context, *args, **kwargs:
+                    wrapped(*args, **kwargs))
         self.environment.filters[name] = fn
 
     def render(self, name, *args, **kwargs):
@@ -38,9 +98,11 @@ class Templates():
 
         Remaining arguments are passed to junja2
         '''
-        template = self.environment.get_template(name, globals=self._get_globals())
-        return template.render(*args, **kwargs)
+        with profiling.timed('template'):
+            template = self.environment.get_template(name, globals=self._get_globals())
+            return template.render(*args, **kwargs)
 
     def render_string(self, string, *args, **kwargs):
-        template = self.environment.from_string(string, globals=self._get_globals())
-        return template.render(*args, **kwargs)
+        with profiling.timed('template'):
+            template = self.environment.from_string(string, globals=self._get_globals())
+            return template.render(*args, **kwargs)
@@ -0,0 +1,421 @@
+import os
+import time
+import gzip
+import pytest
+import tempfile
+
+from . import Site, View, BuildError, Response, FileResponse
+from .builder import Builder, MANIFEST_NAME
+from . import recorder
+from . import builder
+from . import compress
+from .collection import FileCollection, FileCollectionItem, ItemPerPageView
+
+
+def _read_tree(base):
+    result = {}
+    for root, dirs, files in os.walk(base):
+        for fname in files:
+            path = os.path.join(root, fname)
+            with open(path, 'rb') as f:
+                result[os.path.relpath(path, base)] = f.read()
+    return result
+
+
+def _make_site():
+    site = Site()
+
+    @site.register
+    class PagesView(View):
+        def dispatch(self, request):
+            return f'<p>{request.path}</p>'
+
+        def get_all_paths(self):
+            return [f'/page/{i}' for i in range(20)]
+
+    @site.register
+    class TextView(View):
+        def dispatch(self, request):
+            return b'hello'
+
+        def get_all_paths(self):
+            return ['/hello.html']
+
+    return site
+
+
+def test_build():
+    with tempfile.TemporaryDirectory() as dirname:
+        outdir = os.path.join(dirname, 'out')
+        _make_site().build(outdir)
+
+        tree = _read_tree(outdir)
+        assert len(tree) == 22
+        assert MANIFEST_NAME in tree
+        assert tree['page/3/index.html'] == b'<p>/page/3</p>'
+        assert tree['hello.html'] == b'hello'
+
+
+def test_build_jobs_matches_serial():
+    with tempfile.TemporaryDirectory() as dirname:
+        site = _make_site()
+        site.build(os.path.join(dirname, 'serial'))
+        site.build(os.path.join(dirname, 'parallel'), jobs=3)
+
+        assert _read_tree(os.path.join(dirname, 'serial')) == \
+            _read_tree(os.path.join(dirname, 'parallel'))
+
+
+def test_build_jobs_fails_fast():
+    site = _make_site()
+
+    @site.register
+    class BrokenView(View):
+        def dispatch(self, request):
+            raise KeyError('nope')
+
+        def get_all_paths(self):
+            return ['/broken']
+
+    with tempfile.TemporaryDirectory() as dirname:
+        with pytest.raises(BuildError) as excinfo:
+            site.build(os.path.join(dirname, 'out'), jobs=2)
+        assert 'BrokenView' in str(excinfo.value)
+        assert '/broken' in str(excinfo.value)
+
+
+def test_build_copies_file_response():
+    with tempfile.TemporaryDirectory() as dirname:
+        src = os.path.join(dirname, 'logo.png')
+        with open(src, 'wb') as f:
+            f.write(b'\x89PNG not really')
+
+        site = Site()
+
+        @site.register
+        class FileView(View):
+            def dispatch(self, request):
+                return FileResponse(src, content_type='image/png')
+
+            def get_all_paths(self):
+                return ['/logo.png']
+
+        outdir = os.path.join(dirname, 'out')
+        site.build(outdir)
+        out = os.path.join(outdir, 'logo.png')
+        with open(out, 'rb') as f:
+            assert f.read() == b'\x89PNG not really'
+        # A copy, not a link to the source
+        assert not os.path.samefile(src, out)
+
+
+def test_build_incremental():
+    with tempfile.TemporaryDirectory() as dirname:
+        os.makedirs(f'{dirname}/posts')
+        for name in ['a', 'b', 'c']:
+            with open(f'{dirname}/posts/{name}', 'w') as f:
+                f.write(name)
+
+        class MyItem(FileCollectionItem):
+            def __init__(self, fname):
+                with open(fname) as f:
+                    text = f.read()
+                super().__init__(fname, text=text)
+
+        class MyCollection(FileCollection):
+            path = f'{dirname}/posts/*'
+            Item = MyItem
+
+        rendered = []
+        site = Site()
+
+        @site.register
+        class PostView(ItemPerPageView):
+            collection = MyCollection()
+
+            def dispatch(self, request):
+                item = self.get_item_for_request(request)
+                rendered.append(request.path)
+                return item.text
+
+            def get_path_for_item(self, item):
+                return '/' + os.path.basename(item.filename)
+
+        @site.register
+        class ListView(View):
+            def dispatch(self, request):
+                rendered.append(request.path)
+                return ','.join(sorted(i.text for i in PostView.collection))
+
+            def get_all_paths(self):
+                return ['/list']
+
+        outdir = os.path.join(dirname, 'out')
+        site.build(outdir)
+        assert sorted(rendered) == ['/a', '/b', '/c', '/list']
+
+        rendered.clear()
+        site.build(outdir, incremental=True)
+        assert rendered == []
+
+        with open(f'{dirname}/posts/b', 'w') as f:
+            f.write('bb')
+        os.remove(f'{dirname}/posts/c')
+        PostView.collection.load()
+
+        rendered.clear()
+        site.build(outdir, incremental=True)
+        assert sorted(rendered) == ['/b', '/list']
+
+        tree = _read_tree(outdir)
+        assert tree['b/index.html'] == b'bb'
+        assert tree['list/index.html'] == b'a,bb'
+        assert 'c/index.html' not in tree
+
+
+def test_build_atomic():
+    with tempfile.TemporaryDirectory() as dirname:
+        pages = {'/a': 'A', '/b': 'B', '/c/d.html': 'D'}
+        site = Site()
+
+        @site.register
+        class PagesView(View):
+            def dispatch(self, request):
+                return pages[request.path]
+
+            def get_all_paths(self):
+                return list(pages)
+
+        outdir = os.path.join(dirname, 'out')
+        site.build(outdir, atomic=True)
+        assert _read_tree(outdir) == {
+            MANIFEST_NAME: _read_tree(outdir)[MANIFEST_NAME],
+            'a/index.html': b'A',
+            'b/index.html': b'B',
+            'c/d.html': b'D',
+        }
+        a_stat = os.stat(os.path.join(outdir, 'a/index.html'))
+        manifest_path = os.path.join(outdir, MANIFEST_NAME)
+        with open(manifest_path, 'rb') as f:
+            manifest = f.read()
+        # Open the live site's files, to see what the build does to them
+        live_manifest = open(manifest_path, 'rb')
+        live_b = open(os.path.join(outdir, 'b/index.html'), 'rb')
+
+        pages['/b'] = 'changed'
+        del pages['/c/d.html']
+        site.build(outdir, atomic=True)
+
+        # The old site's files were replaced, not written through links
+        with live_manifest, live_b:
+            assert live_manifest.read() == manifest
+            assert live_b.read() == b'B'
+
+        tree = _read_tree(outdir)
+        assert tree['b/index.html'] == b'changed'
+        assert 'c/d.html' not in tree
+        assert not os.path.exists(os.path.join(outdir, 'c'))
+        # Unchanged files are left as they were
+        new_a_stat = os.stat(os.path.join(outdir, 'a/index.html'))
+        assert new_a_stat.st_ino == a_stat.st_ino
+        assert new_a_stat.st_mtime_ns == a_stat.st_mtime_ns
+        assert sorted(os.listdir(dirname)) == ['out']
+
+
+def test_build_compress():
+    with tempfile.TemporaryDirectory() as dirname:
+        site = Site()
+
+        @site.register
+        class PagesView(View):
+            def dispatch(self, request):
+                if request.path == '/image.png':
+                    return Response(b'\0' * 1000, content_type='image/png')
+                return '<p>hello</p>' * 100
+
+            def get_all_paths(self):
+                return ['/a', '/image.png']
+
+        outdir = os.path.join(dirname, 'out')
+        site.build(outdir, compress=True, atomic=True)
+        tree = _read_tree(outdir)
+        assert gzip.decompress(tree['a/index.html.gz']) == \
+            tree['a/index.html']
+        assert 'image.png.gz' not in tree
+
+        # Left alone when the page is the same
+        gz_stat = os.stat(os.path.join(outdir, 'a/index.html.gz'))
+        site.build(outdir, compress=True, atomic=True)
+        new_gz_stat = os.stat(os.path.join(outdir, 'a/index.html.gz'))
+        assert new_gz_stat.st_mtime_ns == gz_stat.st_mtime_ns
+
+
+def test_build_compress_skips_untouched_outputs(monkeypatch):
+    with tempfile.TemporaryDirectory() as dirname:
+        site = Site()
+
+        @site.register
+        class PagesView(View):
+            def dispatch(self, request):
+                return f'<p>{request.path}</p>' * 100
+
+            def get_all_paths(self):
+                return ['/a', '/b']
+
+        outdir = os.path.join(dirname, 'out')
+        site.build(outdir, compress=True, incremental=True)
+        assert os.path.exists(os.path.join(outdir, 'a/index.html.gz'))
+
+        compressed = []
+        compress_file = compress.compress_file
+
+        def recording_compress_file(path, previous):
+            compressed.append(os.path.relpath(path, outdir))
+            return compress_file(path, previous)
+        monkeypatch.setattr(compress, 'compress_file', recording_compress_file)
+
+        site.build(outdir, compress=True, incremental=True)
+        assert compressed == []
+
+        # Made again if a copy goes missing
+        os.remove(os.path.join(outdir, 'a/index.html.gz'))
+        site.build(outdir, compress=True, incremental=True)
+        assert compressed == ['a/index.html']
+        assert os.path.exists(os.path.join(outdir, 'a/index.html.gz'))
+
+
+def test_build_write_errors():
+    with tempfile.TemporaryDirectory() as dirname:
+        site = _make_site()
+        outdir = os.path.join(dirname, 'out')
+        os.makedirs(outdir)
+        # A file where the page's directory should go
+        with open(os.path.join(outdir, 'page'), 'w') as f:
+            f.write('in the way')
+
+        with pytest.raises(OSError):
+            site.build(outdir, incremental=True)
+
+
+def test_builder_write_workers_match_serial():
+    with tempfile.TemporaryDirectory() as dirname:
+        site = _make_site()
+        serial = Builder(site, os.path.join(dirname, 'serial'))
+        serial.write_workers = 1
+        serial.run()
+        threaded = Builder(site, os.path.join(dirname, 'threaded'))
+        threaded.max_queued_writes = 2
+        threaded.run()
+
+        assert _read_tree(os.path.join(dirname, 'serial')) == \
+            _read_tree(os.path.join(dirname, 'threaded'))
+
+
+def test_build_incremental_without_compress_drops_stale_copies():
+    with tempfile.TemporaryDirectory() as dirname:
+        data_path = os.path.join(dirname, 'data.txt')
+        with open(data_path, 'w') as f:
+            f.write('old ' * 100)
+
+        site = Site()
+
+        @site.register
+        class FileView(View):
+            def dispatch(self, request):
+                recorder.record_file(data_path)
+                with open(data_path) as f:
+                    return f.read()
+
+            def get_all_paths(self):
+                return ['/a']
+
+        outdir = os.path.join(dirname, 'out')
+        site.build(outdir, compress=True)
+        assert os.path.exists(os.path.join(outdir, 'a/index.html.gz'))
+
+        with open(data_path, 'w') as f:
+            f.write('new ' * 200)
+        site.build(outdir, incremental=True)
+        tree = _read_tree(outdir)
+        assert tree['a/index.html'] == b'new ' * 200
+        assert 'a/index.html.gz' not in tree
+
+
+def test_build_atomic_needs_force_for_other_dirs():
+    with tempfile.TemporaryDirectory() as dirname:
+        outdir = os.path.join(dirname, 'out')
+        os.makedirs(outdir)
+        with open(os.path.join(outdir, 'CNAME'), 'w') as f:
+            f.write('example.com')
+
+        with pytest.raises(Exception):
+            _make_site().build(outdir, atomic=True)
+        assert os.listdir(outdir) == ['CNAME']
+
+        _make_site().build(outdir, atomic=True, force=True)
+        tree = _read_tree(outdir)
+        assert 'CNAME' not in tree
+        assert tree['hello.html'] == b'hello'
+        assert os.stat(outdir).st_mode & 0o755 == 0o755
+
+
+def test_build_atomic_leaves_siblings():
+    with tempfile.TemporaryDirectory() as dirname:
+        outdir = os.path.join(dirname, 'out')
+        for sibling in ['out.old', 'out.staging']:
+            os.makedirs(os.path.join(dirname, sibling))
+            with open(os.path.join(dirname, sibling, 'notes.txt'), 'w') as f:
+                f.write('mine')
+
+        site = _make_site()
+        site.build(outdir, atomic=True)
+        site.build(outdir, atomic=True)
+
+        assert sorted(os.listdir(dirname)) == ['out', 'out.old', 'out.staging']
+        for sibling in ['out.old', 'out.staging']:
+            assert _read_tree(os.path.join(dirname, sibling)) == \
+                {'notes.txt': b'mine'}
+        assert _read_tree(outdir)['hello.html'] == b'hello'
+
+
+def test_build_atomic_without_exchange(monkeypatch):
+    monkeypatch.setattr(builder, '_exchange', lambda a, b: False)
+    with tempfile.TemporaryDirectory() as dirname:
+        outdir = os.path.join(dirname, 'out')
+        site = _make_site()
+        site.build(outdir, atomic=True)
+        site.build(outdir, atomic=True)
+        assert os.listdir(dirname) == ['out']
+        assert _read_tree(outdir)['page/3/index.html'] == b'<p>/page/3</p>'
+
+
+def test_build_jobs_write_error_stops_workers():
+    with tempfile.TemporaryDirectory() as dirname:
+        log_path = os.path.join(dirname, 'log')
+        site = Site()
+
+        @site.register
+        class SlowView(View):
+            def dispatch(self, request):
+                time.sleep(0.01)
+                with open(log_path, 'a') as f:
+                    f.write(request.path + '\n')
+                return request.path
+
+            def get_all_paths(self):
+                return [f'/page/{i}' for i in range(300)]
+
+        outdir = os.path.join(dirname, 'out')
+        os.makedirs(outdir)
+        # A file where the pages' directory should go
+        with open(os.path.join(outdir, 'page'), 'w') as f:
+            f.write('in the way')
+
+        with pytest.raises(OSError):
+            site.build(outdir, jobs=2, incremental=True)
+        with open(log_path) as f:
+            rendered = len(f.readlines())
+        time.sleep(0.3)
+        with open(log_path) as f:
+            assert len(f.readlines()) == rendered
+        assert rendered < 300
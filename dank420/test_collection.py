@@ -1,9 +1,12 @@
+import os
 import pytest
 import tempfile
 
 from .request import Request
+from . import recorder
 from .collection import (Collection, Item, ItemPerPageView,
-        FileCollection, FileCollectionItem, DoNotLoadException)
+        FileCollection, FileCollectionItem, DoNotLoadException,
+        read_front_matter, ItemLoadError)
 
 def test_collection_raises():
     c = Collection()
@@ -193,3 +196,329 @@ def test_file_collection_reload():
         assert len(l) == 2
         assert l[0].char == 'B'
         assert l[1].char == 'C'
+
+def test_item_per_page_view_reload():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(f'{dirname}/A', 'w') as f:
+            f.write('A')
+
+        class MyFileCollectionItem(FileCollectionItem):
+            def __init__(self, fname):
+                with open(fname, 'r') as f:
+                    char = f.read().strip()
+
+                super().__init__(fname, char=char)
+
+        class MyFileCollection(FileCollection):
+            path = f'{dirname}/*'
+            Item = MyFileCollectionItem
+
+        class View(ItemPerPageView):
+            collection = MyFileCollection()
+
+            def get_path_for_item(self, item):
+                return f'/c/{item.char}/'
+
+        View.collection.load()
+        assert View().get_item_for_request(Request('/c/A', None)).char == 'A'
+
+        with open(f'{dirname}/B', 'w') as f:
+            f.write('B')
+        View.collection._reload_cb(f'{dirname}/B')
+        assert View().get_item_for_request(Request('/c/B', None)).char == 'B'
+
+        with open(f'{dirname}/C', 'w') as f:
+            f.write('B')
+        View.collection._reload_cb(f'{dirname}/C')
+        with pytest.raises(ValueError) as excinfo:
+            View().get_item_for_request(Request('/c/B', None))
+        assert 'Duplicate path /c/B' in str(excinfo.value)
+
+def test_collection_view_memoized():
+    calls = []
+
+    class CountingCollection(BasicCollection):
+        def __iter__(self):
+            calls.append(1)
+            return super().__iter__()
+
+    c = CountingCollection()
+    v = c.filter(a__gt=15).sort('b')
+    assert [i.a for i in v] == [20, 30]
+    assert [i.a for i in v] == [20, 30]
+    assert len(calls) == 1
+
+    c.mark_changed()
+    assert [i.a for i in v] == [20, 30]
+    assert len(calls) == 2
+
+
+class TaggedCollection(Collection):
+    def load(self):
+        self._items = [
+            Item(name='a', tags=['python', 'nix'], category='code'),
+            Item(name='b', tags=[], category='life'),
+            Item(name='c', tags=['python'], category='code'),
+            Item(name='d', tags=['nix', 'nix'], category=None),
+        ]
+        self.mark_changed()
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def record_dependency(self):
+        recorder.record_glob('tagged/*')
+
+
+def _names(it):
+    return [i.name for i in it]
+
+
+def test_collection_index_matches_scan():
+    plain = TaggedCollection()
+    plain.load()
+    indexed = TaggedCollection().index_on('tags', 'category')
+    indexed.load()
+
+    queries = [
+        dict(tags__contains='python'),
+        dict(tags__contains='nix'),
+        dict(category='code'),
+        dict(category__exact='life'),
+        dict(category__in=['life', 'code']),
+        dict(category__in=['code'], tags__contains='nix'),
+        dict(category=None),
+    ]
+    for query in queries:
+        assert _names(indexed.filter(**query)) == _names(plain.filter(**query))
+        assert _names(indexed.sort('name', reverse=True).filter(**query)) == \
+            _names(plain.sort('name', reverse=True).filter(**query))
+
+    # Index is used, so only candidates are checked
+    assert indexed._get_index('tags').positions('contains', 'python') == {0, 2}
+
+
+def test_collection_index_reload():
+    c = TaggedCollection().index_on('category')
+    c.load()
+    assert _names(c.filter(category='code')) == ['a', 'c']
+
+    c._items.append(Item(name='e', tags=[], category='code'))
+    c.mark_changed()
+    assert _names(c.filter(category='code')) == ['a', 'c', 'e']
+
+
+def test_collection_group_by():
+    for c in [TaggedCollection(), TaggedCollection().index_on('tags')]:
+        c.load()
+        groups = c.group_by('tags')
+        assert list(groups.keys()) == ['python', 'nix']
+        assert _names(groups['python']) == ['a', 'c']
+        assert _names(groups['nix']) == ['a', 'd']
+
+        groups = c.sort('name', reverse=True).group_by('category')
+        assert list(groups.keys()) == ['code', 'life']
+        assert _names(groups['code']) == ['c', 'a']
+
+        # Recorded every time, even when the groups come from the index
+        for _ in range(2):
+            with recorder.Recorder() as rec:
+                c.group_by('tags')
+            assert rec.globs == {'tagged/*'}
+
+
+def test_read_front_matter():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(f'{dirname}/A', 'w') as f:
+            f.write('---\ntitle: A\n---\nBody\n')
+        with open(f'{dirname}/B', 'w') as f:
+            f.write('No front matter\n')
+
+        assert read_front_matter(f'{dirname}/A') == ('title: A\n', 17)
+        assert read_front_matter(f'{dirname}/B') == ('', 0)
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_file_collection_lazy_body(use_mmap):
+    with tempfile.TemporaryDirectory() as dirname:
+        for name in 'ABC':
+            with open(f'{dirname}/{name}', 'w') as f:
+                f.write(f'---\ntitle: {name}\n---\nBody of {name}\n')
+
+        class MyFileCollectionItem(FileCollectionItem):
+            max_cached_bodies = 2
+
+            def __init__(self, fname):
+                header, offset = read_front_matter(fname)
+                title = header.split(':')[1].strip()
+                super().__init__(fname, body_offset=offset, title=title)
+
+        MyFileCollectionItem.use_mmap = use_mmap
+
+        class MyFileCollection(FileCollection):
+            path = f'{dirname}/*'
+            Item = MyFileCollectionItem
+
+        c = MyFileCollection().sort('title')
+        c.load()
+        l = list(c)
+        assert 'content' not in l[0].__dict__
+        assert [i.content for i in l] == \
+            ['Body of A\n', 'Body of B\n', 'Body of C\n']
+        assert l[0]['content'] == 'Body of A\n'
+        with pytest.raises(AttributeError):
+            l[0].missing
+
+        with open(f'{dirname}/A', 'w') as f:
+            f.write('---\ntitle: A\n---\nNew body\n')
+        c._reload_cb(f'{dirname}/A')
+        assert list(c)[0].content == 'New body\n'
+
+
+def test_file_collection_body_cache_per_class():
+    with tempfile.TemporaryDirectory() as dirname:
+        for name in 'ABC':
+            with open(f'{dirname}/{name}', 'w') as f:
+                f.write(f'---\ntitle: {name}\n---\nBody of {name}\n')
+
+        class BigItem(FileCollectionItem):
+            def __init__(self, fname):
+                _, offset = read_front_matter(fname)
+                super().__init__(fname, body_offset=offset)
+
+        class SmallItem(BigItem):
+            max_cached_bodies = 1
+
+        big = [BigItem(f'{dirname}/{name}') for name in 'ABC']
+        small = [SmallItem(f'{dirname}/{name}') for name in 'ABC']
+        assert [i.content for i in big] == \
+            ['Body of A\n', 'Body of B\n', 'Body of C\n']
+        assert [i.content for i in small] == \
+            ['Body of A\n', 'Body of B\n', 'Body of C\n']
+
+        # The small cache doesn't evict the bodies of other classes
+        assert len(BigItem._body_cache()._bodies) == 3
+        assert len(SmallItem._body_cache()._bodies) == 1
+
+
+class _CharItem(FileCollectionItem):
+    def __init__(self, fname):
+        with open(fname, 'r') as f:
+            char = f.read().strip()
+        if char == '!':
+            raise DoNotLoadException
+        if char == '?':
+            raise KeyError(char)
+        super().__init__(fname, char=char)
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_file_collection_parallel_load(executor):
+    with tempfile.TemporaryDirectory() as dirname:
+        chars = [chr(ord('a') + i) for i in range(26)] + ['!']
+        for i, char in enumerate(chars):
+            with open(f'{dirname}/{i:02}', 'w') as f:
+                f.write(char)
+
+        class MyFileCollection(FileCollection):
+            path = f'{dirname}/*'
+            Item = _CharItem
+            load_workers = 3
+            load_executor = executor
+
+        c = MyFileCollection()
+        c.load()
+        assert [i.char for i in c] == chars[:-1]
+
+        with open(f'{dirname}/10', 'w') as f:
+            f.write('?')
+        with pytest.raises(ItemLoadError) as excinfo:
+            c.load()
+        assert f'{dirname}/10' in str(excinfo.value)
+        assert 'KeyError' in str(excinfo.value)
+
+
+_loaded = []
+
+class _CountingItem(_CharItem):
+    def __init__(self, fname):
+        _loaded.append(os.path.basename(fname))
+        super().__init__(fname)
+
+
+def test_file_collection_cache():
+    with tempfile.TemporaryDirectory() as dirname:
+        os.makedirs(f'{dirname}/items')
+        for char in 'ab!':
+            with open(f'{dirname}/items/{char}', 'w') as f:
+                f.write(char)
+
+        _loaded.clear()
+
+        class MyFileCollection(FileCollection):
+            path = f'{dirname}/items/*'
+            Item = _CountingItem
+            cache_path = f'{dirname}/cache/items.pickle'
+
+        c = MyFileCollection()
+        c.load()
+        assert sorted(_loaded) == ['!', 'a', 'b']
+        assert [i.char for i in c] == ['a', 'b']
+
+        _loaded.clear()
+        c = MyFileCollection()
+        c.load()
+        assert _loaded == []
+        assert [i.char for i in c] == ['a', 'b']
+
+        with open(f'{dirname}/items/b', 'w') as f:
+            f.write('bb')
+        os.remove(f'{dirname}/items/a')
+        c.load()
+        assert _loaded == ['b']
+        assert [i.char for i in c] == ['bb']
+
+        _loaded.clear()
+        _CountingItem.cache_version = 2
+        try:
+            c.load()
+        finally:
+            del _CountingItem.cache_version
+        assert sorted(_loaded) == ['!', 'b']
+
+
+def test_file_collection_refresh():
+    with tempfile.TemporaryDirectory() as dirname:
+        os.makedirs(f'{dirname}/items/sub')
+        for char in 'abc':
+            with open(f'{dirname}/items/{char}', 'w') as f:
+                f.write(char)
+
+        class MyFileCollection(FileCollection):
+            path = f'{dirname}/items/**'
+            Item = _CountingItem
+
+        _loaded.clear()
+        c = MyFileCollection().sort('char')
+        c.load()
+        assert [i.char for i in c] == ['a', 'b', 'c']
+
+        # Changes found by the stat diff
+        _loaded.clear()
+        os.remove(f'{dirname}/items/a')
+        with open(f'{dirname}/items/sub/d', 'w') as f:
+            f.write('d')
+        with open(f'{dirname}/items/b', 'w') as f:
+            f.write('bb')
+        c.refresh()
+        assert sorted(_loaded) == ['b', 'd']
+        assert [i.char for i in c] == ['bb', 'c', 'd']
+
+        # A batch of events is handled in one go, when next used
+        _loaded.clear()
+        for char in 'cd':
+            c._reload_cb(f'{dirname}/items/{char}')
+        c._reload_cb(f'{dirname}/items/sub/d')
+        assert _loaded == []
+        assert [i.char for i in c] == ['bb', 'c', 'd']
+        assert sorted(_loaded) == ['c', 'd']
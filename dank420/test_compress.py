@@ -0,0 +1,54 @@
+import os
+import gzip
+import tempfile
+
+from . import compress
+
+
+def test_is_compressible():
+    assert compress.is_compressible('text/html')
+    assert compress.is_compressible('text/css; charset=utf-8')
+    assert compress.is_compressible('application/javascript')
+    assert compress.is_compressible('image/svg+xml')
+    assert not compress.is_compressible('image/png')
+    assert not compress.is_compressible(None)
+
+
+def test_gzip_is_deterministic():
+    data = b'hello world ' * 100
+    assert compress.gzip_compress(data) == compress.gzip_compress(data)
+    assert gzip.decompress(compress.gzip_compress(data)) == data
+
+
+def test_compress_file():
+    with tempfile.TemporaryDirectory() as dirname:
+        path = os.path.join(dirname, 'a.html')
+        with open(path, 'wb') as f:
+            f.write(b'<p>hello</p>' * 100)
+
+        result = compress.compress_file(path, {})
+        assert result['.gz'][1]
+        with gzip.open(path + '.gz') as f:
+            assert f.read() == b'<p>hello</p>' * 100
+
+        # Reused while the data is the same
+        mtime = os.stat(path + '.gz').st_mtime_ns
+        assert compress.compress_file(path, result) == result
+        assert os.stat(path + '.gz').st_mtime_ns == mtime
+
+        # Too small to be worth it
+        with open(path, 'wb') as f:
+            f.write(b'<p>hi</p>')
+        result = compress.compress_file(path, result)
+        assert not result['.gz'][1]
+        assert not os.path.exists(path + '.gz')
+
+
+def test_compress_skips_incompressible():
+    with tempfile.TemporaryDirectory() as dirname:
+        path = os.path.join(dirname, 'random.txt')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(4096))
+        result = compress.compress_file(path, {})
+        assert not result['.gz'][1]
+        assert not os.path.exists(path + '.gz')
@@ -0,0 +1,199 @@
+import os
+import time
+import tempfile
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+
+from . import Site, View
+from . import recorder
+from .static import StaticView
+from .devserver import DevServer, IMMUTABLE_CACHE_CONTROL
+
+
+def test_etag():
+    site = Site()
+
+    @site.register
+    class PageView(View):
+        def dispatch(self, request):
+            return '<p>hello</p>'
+
+        def get_all_paths(self):
+            return ['/']
+
+    client = Client(DevServer(site).wsgi_app, BaseResponse)
+    resp = client.get('/')
+    assert resp.status_code == 200
+    assert resp.data == b'<p>hello</p>'
+    etag = resp.headers['ETag']
+    assert not etag.startswith('W/')
+
+    resp = client.get('/', headers={'If-None-Match': etag})
+    assert resp.status_code == 304
+    assert resp.data == b''
+
+    resp = client.get('/', headers={'If-None-Match': '"other"'})
+    assert resp.status_code == 200
+
+
+def test_static_immutable():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(os.path.join(dirname, 'main.css'), 'w') as f:
+            f.write('body {}')
+
+        site = Site()
+
+        @site.register
+        class MyStaticView(StaticView):
+            base = dirname
+
+        client = Client(DevServer(site).wsgi_app, BaseResponse)
+        resp = client.get(MyStaticView.filename_to_path('main.css'))
+        assert resp.status_code == 200
+        assert resp.data == b'body {}'
+        assert resp.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+
+        resp = client.get('/static/main.H{}.css'.format('0' * 64))
+        assert resp.status_code == 404
+        assert 'Cache-Control' not in resp.headers
+
+
+def test_render_cache():
+    with tempfile.TemporaryDirectory() as dirname:
+        data_path = os.path.join(dirname, 'data.txt')
+        with open(data_path, 'w') as f:
+            f.write('one')
+        calls = []
+
+        site = Site()
+
+        @site.register
+        class FileView(View):
+            def dispatch(self, request):
+                calls.append(request.path)
+                recorder.record_file(data_path)
+                with open(data_path) as f:
+                    return f.read()
+
+            def get_all_paths(self):
+                return ['/file']
+
+        @site.register
+        class GlobView(View):
+            def dispatch(self, request):
+                calls.append(request.path)
+                recorder.record_glob(os.path.join(dirname, 'posts', '*.md'))
+                return 'posts'
+
+            def get_all_paths(self):
+                return ['/posts']
+
+        server = DevServer(site)
+        assert server.dispatch('/file')[0].data == b'one'
+        assert server.dispatch('/file/')[0].data == b'one'
+        server.dispatch('/posts')
+        server.dispatch('/posts')
+        assert calls == ['/file', '/posts']
+        assert os.path.abspath(dirname) in site._watch_roots
+
+        server._files_changed([os.path.join(dirname, 'unrelated.txt')])
+        server.dispatch('/file')
+        server.dispatch('/posts')
+        assert len(calls) == 2
+
+        with open(data_path, 'w') as f:
+            f.write('two')
+        server._files_changed([data_path])
+        assert server.dispatch('/file')[0].data == b'two'
+        server.dispatch('/posts')
+        assert calls == ['/file', '/posts', '/file']
+
+        server._files_changed([os.path.join(dirname, 'posts', 'new.md')])
+        server.dispatch('/file')
+        server.dispatch('/posts')
+        assert calls == ['/file', '/posts', '/file', '/posts']
+
+
+def test_render_cache_with_watching():
+    with tempfile.TemporaryDirectory() as dirname:
+        data_path = os.path.join(dirname, 'data.txt')
+        with open(data_path, 'w') as f:
+            f.write('one')
+        with open(os.path.join(dirname, 'main.css'), 'w') as f:
+            f.write('body {}')
+        renders = []
+        listings = []
+
+        site = Site()
+        site._watchdog_handler.debounce = 0.05
+
+        @site.register
+        class FileView(View):
+            def dispatch(self, request):
+                renders.append(request.path)
+                recorder.record_file(data_path)
+                with open(data_path) as f:
+                    return f.read()
+
+            def get_all_paths(self):
+                listings.append(1)
+                return ['/file']
+
+        @site.register
+        class MyStaticView(StaticView):
+            base = dirname
+
+        client = Client(DevServer(site).wsgi_app, BaseResponse)
+        site.start_watching()
+        try:
+            css_url = MyStaticView.filename_to_path('main.css')
+            for _ in range(3):
+                assert client.get('/file').data == b'one'
+                assert client.get(css_url).data == b'body {}'
+                time.sleep(0.3)
+            assert renders == ['/file']
+            assert len(listings) == 1
+
+            with open(data_path, 'w') as f:
+                f.write('two')
+            for _ in range(50):
+                time.sleep(0.1)
+                if client.get('/file').data == b'two':
+                    break
+            assert renders == ['/file', '/file']
+            assert len(listings) == 1
+        finally:
+            site._observer.stop()
+
+
+def test_render_cache_changes_during_render():
+    renders = []
+    changes = []
+
+    site = Site()
+    server = DevServer(site)
+
+    @site.register
+    class ChangingView(View):
+        def dispatch(self, request):
+            renders.append(request.path)
+            recorder.record_file('/dep')
+            server._files_changed(changes)
+            return 'page'
+
+        def get_all_paths(self):
+            return ['/a']
+
+    # Changes to other files don't stop the page being cached
+    changes[:] = ['/unrelated']
+    server.dispatch('/a')
+    server.dispatch('/a')
+    assert len(renders) == 1
+
+    # But a change to one of its inputs while rendering does
+    server._files_changed(['/dep'])
+    changes[:] = ['/dep']
+    server.dispatch('/a')
+    server.dispatch('/a')
+    assert len(renders) == 3
+    assert server._changes == []
@@ -0,0 +1,62 @@
+import random
+import lookupy
+import pytest
+from lookupy.lookupy import LookupyError
+
+from .collection import Item
+from .lookups import compile_lookup
+
+
+def _items():
+    rng = random.Random(420)
+    words = ['python', 'Nix', 'rust', 'PYTHON3', '', None]
+    items = []
+    for i in range(200):
+        items.append(Item(
+            n=rng.choice([1, 5, 10, 20, None]),
+            word=rng.choice(words),
+            tags=rng.choice([['python'], ['nix', 'python'], [], None]),
+            meta={'depth': rng.choice([0, 1, 2]), 'inner': {'x': i % 3}},
+        ))
+    return items
+
+
+_QUERIES = [
+    lookupy.Q(n=10),
+    lookupy.Q(n__exact=5),
+    lookupy.Q(n__neq=5),
+    lookupy.Q(n__gt=5),
+    lookupy.Q(n__gte=5),
+    lookupy.Q(n__lt=10),
+    lookupy.Q(n__lte=10),
+    lookupy.Q(n__in=[1, 20]),
+    lookupy.Q(word__contains='yth'),
+    lookupy.Q(word__icontains='YTH'),
+    lookupy.Q(word__startswith='py'),
+    lookupy.Q(word__istartswith='PY'),
+    lookupy.Q(word__endswith='on'),
+    lookupy.Q(word__iendswith='ON3'),
+    lookupy.Q(word__regex=r'^[a-z]+$'),
+    lookupy.Q(tags__contains='python'),
+    lookupy.Q(meta__depth=1),
+    lookupy.Q(meta__inner__x__gt=0),
+    lookupy.Q(meta__inner__x=2, n__gt=1),
+    lookupy.Q(meta__missing=None),
+    lookupy.Q(n=10) | lookupy.Q(word='rust'),
+    lookupy.Q(n=10) & ~lookupy.Q(word='rust'),
+    ~(lookupy.Q(n=10) | lookupy.Q(word='rust')),
+    ~lookupy.Q(n__in=[1, 5], word__startswith='p'),
+]
+
+
+@pytest.mark.parametrize('query', _QUERIES)
+def test_compile_lookup_matches_lookupy(query):
+    predicate = compile_lookup(query)
+    for item in _items():
+        assert predicate(item) == query.evaluate(item)
+
+
+def test_compile_lookup_bad_value():
+    predicate = compile_lookup(lookupy.Q(word__contains=5))
+    with pytest.raises(LookupyError):
+        predicate(Item(word='x'))
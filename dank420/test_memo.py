@@ -0,0 +1,58 @@
+import tempfile
+
+from . import memo
+from .collection import Item
+
+
+def test_memoized_property():
+    calls = []
+
+    class MyItem(Item):
+        @memo.memoized_property('content')
+        def html(self):
+            calls.append(self.content)
+            return f'<p>{self.content}</p>'
+
+    a = MyItem(content='a')
+    assert a.html == '<p>a</p>'
+    assert a.html == '<p>a</p>'
+    assert MyItem(content='a').html == '<p>a</p>'
+    assert calls == ['a']
+
+    a.content = 'b'
+    assert a.html == '<p>b</p>'
+    assert calls == ['a', 'b']
+
+
+def test_memoized_property_version_and_store(monkeypatch):
+    with tempfile.TemporaryDirectory() as dirname:
+        calls = []
+
+        def make_class(version):
+            class MyItem(Item):
+                @memo.memoized_property('content', version=version,
+                                        store=memo.DiskStore(dirname))
+                def html(self):
+                    calls.append(version)
+                    return f'{version}:{self.content}'
+            return MyItem
+
+        assert make_class(1)(content='x').html == '1:x'
+        assert make_class(2)(content='x').html == '2:x'
+        assert calls == [1, 2]
+
+        # Values come back from the disk store when memory is empty
+        monkeypatch.setattr(memo, '_memory_store', memo.MemoryStore())
+        assert make_class(1)(content='x').html == '1:x'
+        assert calls == [1, 2]
+
+
+def test_memory_store_lru():
+    store = memo.MemoryStore(max_entries=2)
+    store.set('a', 1)
+    store.set('b', 2)
+    assert store.get('a') == 1
+    store.set('c', 3)
+    assert store.get('b') is memo._MISSING
+    assert store.get('a') == 1
+    assert store.get('c') == 3
@@ -1,4 +1,4 @@
-from .pathspec import Pathspec
+from .pathspec import Pathspec, PathspecSet
 
 def test_pathspec_to_regex_static():
     ps = Pathspec('/')
@@ -41,3 +41,47 @@ def test_pathspec_format():
     assert ps.format(post='hello/y') == '/blog/hello/y'
     ps = Pathspec('/<blog>/<post>')
     assert ps.format(blog='blog1', post='hello') == '/blog1/hello'
+
+
+def test_pathspec_set():
+    specs = PathspecSet()
+    assert specs.match('/') is None
+
+    blog = Pathspec('/blog/<post>')
+    specs.add(blog)
+    specs.add(Pathspec('/blog/<*post>'), 'deep')
+    specs.add(Pathspec('/<page>'), 'page')
+    specs.add(Pathspec('/<post>'), 'shadowed')
+    assert len(specs) == 4
+
+    assert specs.match('/blog/hello') == (blog, {'post': 'hello'})
+    assert specs.match('/blog/hello/more') == ('deep', {'post': 'hello/more'})
+    assert specs.match('/about') == ('page', {'page': 'about'})
+    assert specs.match('/a/b/c') is None
+
+    assert list(specs.match_all('/about')) == [
+        ('page', {'page': 'about'}), ('shadowed', {'post': 'about'})]
+    assert list(specs.match_all('/blog/x')) == [
+        (blog, {'post': 'x'}), ('deep', {'post': 'x'})]
+    assert list(specs.match_all('/a/b/c')) == []
+
+
+def test_pathspec_set_matches_pathspecs():
+    raw = ['/', '/home', '/blog/<post>/<view>', '/static/<*name>',
+           '/<a>/<b>', '/tag/<tag>']
+    specs = PathspecSet()
+    for s in raw:
+        specs.add(Pathspec(s))
+    paths = ['/', '/home', '/blog/x/full', '/static/css/main.css',
+             '/tag/gtk', '/q/r', '/nope/a/b/c', '/home/']
+    for path in paths:
+        expected = None
+        for s in raw:
+            match = Pathspec(s).match(path)
+            if match is not None:
+                expected = (s, match)
+                break
+        result = specs.match(path)
+        if result is not None:
+            result = (result[0]._pathspec, result[1])
+        assert result == expected
@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import tempfile
+
+from . import Site, View
+from .profiling import BuildProfile, Timings, timed
+
+
+def test_timed():
+    # Not timing a page; does nothing
+    with timed('template'):
+        pass
+
+    with Timings() as timings:
+        with timed('template'):
+            with timed('template'):
+                time.sleep(0.01)
+    assert 0.01 <= timings.seconds['template'] < 0.02 * 2
+    assert 'dispatch' not in timings.seconds
+
+
+def _make_site():
+    site = Site()
+
+    @site.register
+    class SlowView(View):
+        def dispatch(self, request):
+            time.sleep(0.02)
+            return site.templates.render_string('<p>{{ x }}</p>', x=request.path)
+
+        def get_all_paths(self):
+            return ['/slow']
+
+    @site.register
+    class FastView(View):
+        def dispatch(self, request):
+            return 'fast'
+
+        def get_all_paths(self):
+            return [f'/fast/{i}' for i in range(5)]
+
+    return site
+
+
+def test_build_profile():
+    for jobs in [1, 2]:
+        with tempfile.TemporaryDirectory() as dirname:
+            profile = BuildProfile(slowest=2, trace_memory=True)
+            _make_site().build(os.path.join(dirname, 'out'), jobs=jobs,
+                               profile=profile)
+            profile.save(os.path.join(dirname, 'profile.json'))
+            with open(os.path.join(dirname, 'profile.json')) as f:
+                report = json.load(f)
+
+            assert report['totals']['paths'] == 6
+            assert report['totals']['bytes_written'] == len('<p>/slow</p>') + 5 * 4
+            assert report['total_seconds'] >= 0.02
+
+            slowest = report['slowest_paths']
+            assert len(slowest) == 2
+            assert slowest[0]['path'] == '/slow'
+            assert slowest[0]['handler'].endswith('SlowView')
+            assert slowest[0]['dispatch'] >= 0.02
+            assert slowest[0]['template'] > 0
+
+            handlers = report['handlers']
+            fast = [v for k, v in handlers.items() if k.endswith('FastView')][0]
+            assert fast['paths'] == 5
+            assert report['paths']['/fast/3']['bytes_written'] == 4
+            assert report['memory']['peak_bytes'] > 0
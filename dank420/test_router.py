@@ -0,0 +1,96 @@
+from .router import Router
+from .view import View
+from .pathspec import Pathspec
+
+
+def _make_view(paths, calls=None):
+    class MyView(View):
+        def get_all_paths(self):
+            if calls is not None:
+                calls.append(1)
+            return list(paths)
+    return MyView
+
+
+def test_router_find():
+    calls = []
+    A = _make_view(['/', '/a/'], calls)
+    B = _make_view(['/b', '/a'], calls)
+    router = Router()
+    router.add(A)
+    router.add(B)
+
+    assert isinstance(router.find('/'), A)
+    assert isinstance(router.find('/a'), A)
+    assert isinstance(router.find('/b/'), B)
+    assert router.find('/c') is None
+    # The table is only built once
+    assert len(calls) == 2
+
+
+def test_router_invalidate():
+    paths = ['/a']
+    A = _make_view(paths)
+    router = Router()
+    router.add(A)
+    assert router.find('/new') is None
+
+    paths.append('/new')
+    assert router.find('/new') is None
+    router.invalidate()
+    assert isinstance(router.find('/new'), A)
+
+
+def test_router_fallback_order():
+    class Fallback(View):
+        enumerate_paths = False
+
+        def does_include_path(self, path):
+            return path.startswith('/x')
+
+    A = _make_view(['/x1'])
+    B = _make_view(['/x2'])
+    router = Router()
+    router.add(A)
+    router.add(Fallback)
+    router.add(B)
+
+    assert isinstance(router.find('/x1'), A)
+    assert isinstance(router.find('/x2'), Fallback)
+    assert isinstance(router.find('/x3'), Fallback)
+
+
+def test_router_fallback_pathspecs():
+    calls = []
+
+    def make_fallback(spec, accept):
+        class Fallback(View):
+            enumerate_paths = False
+            pathspec = Pathspec(spec)
+
+            def does_include_path(self, path):
+                calls.append((spec, path))
+                return accept(path)
+        return Fallback
+
+    Picky = make_fallback('/files/<*name>', lambda p: p.endswith('.css'))
+    Files = make_fallback('/files/<*name>', lambda p: True)
+    Images = make_fallback('/img/<name>', lambda p: True)
+    A = _make_view(['/files/a.css'])
+    router = Router()
+    router.add(Picky)
+    router.add(A)
+    router.add(Files)
+    router.add(Images)
+
+    assert isinstance(router.find('/img/logo'), Images)
+    assert calls == [('/img/<name>', '/img/logo')]
+
+    assert isinstance(router.find('/files/a.css'), Picky)
+    # Rejected by the first fallback, so the later one is asked
+    assert isinstance(router.find('/files/a.js'), Files)
+    # Fallbacks are not asked about paths outside their pathspec
+    del calls[:]
+    router.add(make_fallback('/files/<*name>', lambda p: False))
+    assert router.find('/nothing') is None
+    assert calls == []
@@ -0,0 +1,92 @@
+import os
+import time
+import tempfile
+
+from . import Site
+
+
+def test_reload_callbacks_batch():
+    site = Site()
+    single = []
+    batches = []
+    site.register_reload_callback(single.append, './posts/*.md')
+    site.register_reload_callback(batches.append, './posts/*', batch=True)
+    assert os.path.abspath('./posts') in site._watch_roots
+
+    post = os.path.abspath('./posts/a.md')
+    image = os.path.abspath('./posts/a.png')
+    site._watchdog_handler.call_callbacks([post, image, os.path.abspath('b.md')])
+    assert single == [post]
+    assert batches == [[post, image]]
+
+
+def test_watching_debounces():
+    with tempfile.TemporaryDirectory() as dirname:
+        site = Site()
+        batches = []
+        site.register_reload_callback(batches.append,
+                os.path.join(dirname, '*.txt'), batch=True)
+        site.start_watching()
+
+        time.sleep(0.2)
+        for name in ['a', 'b', 'c']:
+            with open(os.path.join(dirname, name + '.txt'), 'w') as f:
+                f.write(name)
+        os.rename(os.path.join(dirname, 'c.txt'),
+                  os.path.join(dirname, 'd.txt'))
+
+        for _ in range(50):
+            if batches:
+                break
+            time.sleep(0.1)
+        time.sleep(0.3)
+
+        changed = {os.path.basename(p) for batch in batches for p in batch}
+        assert changed == {'a.txt', 'b.txt', 'c.txt', 'd.txt'}
+        assert len(batches) == 1
+        site._observer.stop()
+
+
+def test_reading_files_does_not_call_callbacks():
+    with tempfile.TemporaryDirectory() as dirname:
+        path = os.path.join(dirname, 'a.txt')
+        with open(path, 'w') as f:
+            f.write('a')
+
+        site = Site()
+        site._watchdog_handler.debounce = 0.05
+        changed = []
+        site.register_reload_callback(changed.append,
+                os.path.join(dirname, '*'))
+        site.start_watching()
+        try:
+            time.sleep(0.2)
+            for _ in range(3):
+                with open(path) as f:
+                    f.read()
+            time.sleep(0.5)
+            assert changed == []
+
+            with open(path, 'w') as f:
+                f.write('b')
+            for _ in range(50):
+                if changed:
+                    break
+                time.sleep(0.1)
+            assert changed and set(changed) == {path}
+        finally:
+            site._observer.stop()
+
+
+def test_catch_all_callbacks_keep_router():
+    site = Site()
+    calls = []
+    site.register_reload_callback(calls.append, None, batch=True)
+    version = site.router._version
+    site._watchdog_handler.call_callbacks([os.path.abspath('x.css')])
+    assert calls == [[os.path.abspath('x.css')]]
+    assert site.router._version == version
+
+    site.register_reload_callback(calls.append, './*.css')
+    site._watchdog_handler.call_callbacks([os.path.abspath('x.css')])
+    assert site.router._version == version + 1
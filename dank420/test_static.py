@@ -0,0 +1,173 @@
+import os
+import tempfile
+
+from .request import Request
+from .response import FileResponse
+from .static import StaticView, Transform, _HashCache, _get_hash
+
+
+def test_hash_cache():
+    with tempfile.TemporaryDirectory() as dirname:
+        path = f'{dirname}/A'
+        with open(path, 'w') as f:
+            f.write('A')
+
+        calls = []
+        def compute():
+            calls.append(1)
+            with open(path, 'rb') as f:
+                return _get_hash(f.read())
+
+        cache = _HashCache()
+        h1 = cache.get('reader', path, compute)
+        h2 = cache.get('reader', path, compute)
+        assert h1 == h2
+        assert len(calls) == 1
+
+        cache.get('other_reader', path, compute)
+        assert len(calls) == 2
+
+        with open(path, 'w') as f:
+            f.write('BB')
+        h3 = cache.get('reader', path, compute)
+        assert h3 != h1
+        assert len(calls) == 3
+
+
+def test_hash_cache_persists():
+    with tempfile.TemporaryDirectory() as dirname:
+        path = f'{dirname}/A'
+        with open(path, 'w') as f:
+            f.write('A')
+        persist_path = f'{dirname}/cache/hashes.json'
+
+        cache = _HashCache(persist_path)
+        h1 = cache.get('reader', path, lambda: 'H1')
+        cache.save()
+
+        cache = _HashCache(persist_path)
+        assert cache.get('reader', path, lambda: 'H2') == h1
+
+
+def test_static_view_paths():
+    with tempfile.TemporaryDirectory() as dirname:
+        os.makedirs(f'{dirname}/sub')
+        with open(f'{dirname}/sub/main.css', 'w') as f:
+            f.write('body {}')
+
+        class MyStaticView(StaticView):
+            base = dirname
+
+        class UpperStaticView(StaticView):
+            base = dirname
+
+            def read_path(self, path):
+                return super().read_path(path).upper()
+
+        url = MyStaticView.filename_to_path('sub/main.css')
+        assert url == MyStaticView().get_all_paths()[0]
+        assert MyStaticView().does_include_path(url)
+        assert not UpperStaticView().does_include_path(url)
+
+        upper_url = UpperStaticView.filename_to_path('sub/main.css')
+        assert upper_url != url
+        assert UpperStaticView().does_include_path(upper_url)
+
+
+def test_static_view_read_path_override_not_stat_cached():
+    with tempfile.TemporaryDirectory() as dirname:
+        os.makedirs(f'{dirname}/static')
+        with open(f'{dirname}/static/main.css', 'w') as f:
+            f.write('@import "colors";')
+        colors_path = f'{dirname}/colors'
+        with open(colors_path, 'w') as f:
+            f.write('red')
+
+        class ImportingStaticView(StaticView):
+            base = f'{dirname}/static'
+            hash_cache_path = f'{dirname}/hashes.json'
+
+            def read_path(self, path):
+                # Follows the import, like a SCSS compiler would
+                with open(colors_path, 'rb') as f:
+                    return super().read_path(path) + f.read()
+
+        url = ImportingStaticView().get_all_paths()[0]
+        with open(colors_path, 'w') as f:
+            f.write('blue')
+        new_url = ImportingStaticView().get_all_paths()[0]
+        assert new_url != url
+        assert ImportingStaticView().does_include_path(new_url)
+        assert not ImportingStaticView().does_include_path(url)
+
+
+def test_static_view_transform():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(f'{dirname}/main.up', 'w') as f:
+            f.write('main')
+        with open(f'{dirname}/dep.txt', 'w') as f:
+            f.write('dep')
+
+        calls = []
+
+        class UpperTransform(Transform):
+            extensions = ('.up',)
+            content_type = 'text/css'
+
+            def apply(self, path):
+                calls.append(path)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                with open(f'{dirname}/dep.txt', 'rb') as f:
+                    return (data + f.read()).upper()
+
+            def get_dependencies(self, path):
+                return [f'{dirname}/dep.txt']
+
+        class MyStaticView(StaticView):
+            base = dirname
+            transforms = [UpperTransform()]
+
+        url = MyStaticView.filename_to_path('main.up')
+        view = MyStaticView()
+        assert view.does_include_path(url)
+        assert url in view.get_all_paths()
+        resp = view.dispatch(Request(url, None))
+        assert resp.data == b'MAINDEP'
+        assert resp.content_type == 'text/css'
+        assert len(calls) == 1
+
+        with open(f'{dirname}/dep.txt', 'w') as f:
+            f.write('changed dependency')
+        assert not view.does_include_path(url)
+        new_url = MyStaticView.filename_to_path('main.up')
+        assert view.dispatch(Request(new_url, None)).data == \
+            b'MAINCHANGED DEPENDENCY'
+        assert len(calls) == 2
+
+
+def test_static_view_file_response():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(f'{dirname}/main.css', 'w') as f:
+            f.write('body {}')
+
+        class MyStaticView(StaticView):
+            base = dirname
+
+        class UpperStaticView(StaticView):
+            base = dirname
+
+            def read_path(self, path):
+                return super().read_path(path).upper()
+
+        url = MyStaticView.filename_to_path('main.css')
+        resp = MyStaticView().dispatch(Request(url, None))
+        assert isinstance(resp, FileResponse)
+        assert resp.path == os.path.join(dirname, 'main.css')
+        assert resp.data == b'body {}'
+        assert resp.content_type == 'text/css'
+
+        url = UpperStaticView.filename_to_path('main.css')
+        resp = UpperStaticView().dispatch(Request(url, None))
+        assert not isinstance(resp, FileResponse)
+        assert resp.data == b'BODY {}'
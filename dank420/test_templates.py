@@ -0,0 +1,47 @@
+import tempfile
+
+from .templates import Templates
+from . import recorder
+
+
+def _make_templates(dirname, **kwargs):
+    class MyTemplates(Templates):
+        path = dirname
+    return MyTemplates(None, **kwargs)
+
+
+def test_templates_cache_and_volatile_filter():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(f'{dirname}/page.html', 'w') as f:
+            f.write('{{ "main.css" | versioned }}')
+
+        version = ['1']
+        templates = _make_templates(dirname)
+        templates.register_filter('versioned',
+                lambda name: name + '?' + version[0], volatile=True)
+
+        assert templates.render('page.html') == 'main.css?1'
+        version[0] = '2'
+        assert templates.render('page.html') == 'main.css?2'
+        assert templates.environment.get_template('page.html') is \
+            templates.environment.get_template('page.html')
+
+        with open(f'{dirname}/page.html', 'w') as f:
+            f.write('changed')
+        assert templates.render('page.html') == 'main.css?2'
+        templates._reload_cb(f'{dirname}/page.html')
+        assert templates.render('page.html') == 'changed'
+
+
+def test_templates_record_includes():
+    with tempfile.TemporaryDirectory() as dirname:
+        with open(f'{dirname}/base.html', 'w') as f:
+            f.write('base {% block body %}{% endblock %}')
+        with open(f'{dirname}/page.html', 'w') as f:
+            f.write('{% extends "base.html" %}{% block body %}page{% endblock %}')
+
+        templates = _make_templates(dirname, bytecode_cache_dir=f'{dirname}/cache')
+        for i in range(2):
+            with recorder.Recorder() as rec:
+                assert templates.render('page.html') == 'base page'
+            assert rec.files == {f'{dirname}/base.html', f'{dirname}/page.html'}
@@ -1,3 +1,7 @@
+import os
+import glob
+import tempfile
+
 from . import util
 
 def test_normalize_path():
@@ -28,3 +32,46 @@ def test_slugify_grow():
             'my-watch-runs-gnu-linux-and-it-is-amazing')]
     for value, expected in cases:
         assert util.slugify_grow(value) == expected
+
+
+def test_scan_glob():
+    with tempfile.TemporaryDirectory() as dirname:
+        for path in ['a.md', 'b.txt', '.hidden.md', 'sub/c.md', 'sub/d/e.md',
+                     'sub/d/f.txt', 'other/g.md']:
+            os.makedirs(os.path.dirname(f'{dirname}/{path}'), exist_ok=True)
+            with open(f'{dirname}/{path}', 'w') as f:
+                f.write(path)
+
+        patterns = ['*', '*.md', '**.md', '**/*.md', 'sub/**', 'sub/*/*.md',
+                    's*/**/*.txt', 'a.md', 'missing/*', '.*']
+        for pattern in patterns:
+            pattern = f'{dirname}/{pattern}'
+            expected = sorted(p for p in glob.iglob(pattern, recursive=True)
+                              if os.path.isfile(p))
+            found = sorted(path for path, st in util.scan_glob(pattern))
+            assert found == expected, pattern
+
+        for path, st in util.scan_glob(f'{dirname}/sub/**'):
+            assert st.st_size == os.stat(path).st_size
+
+
+def test_copy_file():
+    with tempfile.TemporaryDirectory() as dirname:
+        data = os.urandom(200000)
+        with open(f'{dirname}/src', 'wb') as f:
+            f.write(data)
+        with open(f'{dirname}/dst', 'wb') as f:
+            f.write(b'old contents that are longer' * 10000)
+
+        util.copy_file(f'{dirname}/src', f'{dirname}/dst')
+        with open(f'{dirname}/dst', 'rb') as f:
+            assert f.read() == data
+
+
+def test_glob_root():
+    assert util.glob_root('./posts/*.md') == './posts'
+    assert util.glob_root('./posts/**/*.md') == './posts'
+    assert util.glob_root('templates/*') == 'templates'
+    assert util.glob_root('*.md') == '.'
+    assert util.glob_root('/abs/dir/file.txt') == '/abs/dir'
+    assert util.glob_root('/*') == '/'
@@ -1,4 +1,9 @@
 import re
+import os
+import glob
+import errno
+import shutil
+import fnmatch
 
 def normalize_path(path):
     '''
@@ -30,3 +35,143 @@ def slugify_grow(text, delim=u'-'):
     words = [word for word in _GROW_SLUG_REGEX.split(text.lower()) if word]
     return delim.join(words)
 
+
+
+def _copy_in_kernel(fsrc, fdst, size):
+    '''
+    Copy using copy_file_range (which can reflink on filesystems that
+    support it), or sendfile.  Returns how many bytes were copied
+    '''
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    offset = 0
+    try:
+        while offset < size:
+            if copy_file_range is not None:
+                n = copy_file_range(fsrc.fileno(), fdst.fileno(), size - offset)
+            else:
+                n = os.sendfile(fdst.fileno(), fsrc.fileno(), offset,
+                                size - offset)
+            if n == 0:
+                break
+            offset += n
+    except OSError as e:
+        # Not supported here (eg. across filesystems); copy the rest by hand
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                           errno.EOPNOTSUPP, errno.ENOTSUP):
+            raise
+    return offset
+
+
+def copy_file(src, dst):
+    '''
+    Copy the contents of a file, without reading the data into python
+    where the OS allows it
+
+    Args:
+        src (string): file to copy
+        dst (string): file to write; replaced if it exists
+    '''
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        if hasattr(os, 'copy_file_range') or hasattr(os, 'sendfile'):
+            copied = _copy_in_kernel(fsrc, fdst, size)
+        if copied < size:
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            shutil.copyfileobj(fsrc, fdst)
+
+
+def _list_dir(dirname):
+    try:
+        with os.scandir(dirname or '.') as it:
+            return list(it)
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return []
+
+
+def _scan_parts(dirname, parts):
+    part, rest = parts[0], parts[1:]
+    if part == '**':
+        # Matches zero or more directories
+        yield from _scan_parts(dirname, rest)
+        for entry in _list_dir(dirname):
+            if not entry.name.startswith('.') and entry.is_dir():
+                yield from _scan_parts(os.path.join(dirname, entry.name), parts)
+        return
+
+    magic = glob.has_magic(part)
+    for entry in _list_dir(dirname):
+        if magic:
+            # Like glob, wildcards don't match hidden files
+            if entry.name.startswith('.') and not part.startswith('.'):
+                continue
+            if not fnmatch.fnmatchcase(entry.name, part):
+                continue
+        elif entry.name != part:
+            continue
+
+        path = os.path.join(dirname, entry.name)
+        if rest:
+            if entry.is_dir():
+                yield from _scan_parts(path, rest)
+        elif entry.is_file():
+            yield path, entry.stat()
+
+
+def _split_magic(pattern):
+    '''
+    Returns a tuple of the directory before the first wildcard, and the
+    parts of the pattern from the wildcard on (empty if it has none)
+    '''
+    parts = pattern.split('/')
+    first_magic = 0
+    while first_magic < len(parts) and not glob.has_magic(parts[first_magic]):
+        first_magic += 1
+
+    base = '/'.join(parts[:first_magic])
+    if first_magic == 1 and parts[0] == '':
+        base = '/'
+    return base, parts[first_magic:]
+
+
+def scan_glob(pattern):
+    '''
+    Find the files matching a glob, along with their stat info, using
+    os.scandir.  Matches the same as `glob.iglob(pattern, recursive=True)`,
+    but only gives back files (not directories)
+
+    Args:
+        pattern (string): glob pattern, using / as the separator
+
+    Returns:
+        iterator of (path, os.stat_result)
+    '''
+    base, parts = _split_magic(pattern)
+    if not parts:
+        if os.path.isfile(pattern):
+            yield pattern, os.stat(pattern)
+        return
+
+    if parts[-1] == '**':
+        parts.append('*')
+    seen = set()
+    for path, st in _scan_parts(base, parts):
+        # A path can be found twice through different `**`s
+        if path not in seen:
+            seen.add(path)
+            yield path, st
+
+
+def glob_root(pattern):
+    '''
+    Returns the deepest directory that holds every file a glob can match;
+    eg. `./posts` for `./posts/**/*.md`
+
+    Args:
+        pattern (string): glob pattern, using / as the separator
+    '''
+    base, parts = _split_magic(pattern)
+    if not parts:
+        base = os.path.dirname(pattern)
+    return base or '.'
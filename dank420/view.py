@@ -5,7 +5,18 @@ class View():
     A view is something that renders paths in your site
 
     Do not override __init__, `dispatch` is where the action is at
+
+    Attributes:
+        enumerate_paths (bool): if True, the dev server routes requests
+            using a table built from `get_all_paths`.  Set it to False if
+            listing the paths is expensive or they change often, and the
+            router will call `does_include_path` instead
+        pathspec (Pathspec or None): for views with enumerate_paths False,
+            a pathspec that every path of the view matches.  The router
+            only calls `does_include_path` for paths that match it
     '''
+    enumerate_paths = True
+    pathspec = None
 
     def __init__(self):
         pass
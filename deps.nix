@@ -47,6 +47,7 @@ rec {
   forSample = with py.pkgs; [
     pyscss
     python-frontmatter
+    pyyaml
     markdown
     pygments
   ];
@@ -4,12 +4,14 @@ from dank420 import Site, View, Pathspec
 from dank420 import static
 from dank420 import collection
 from dank420 import util
+from dank420 import memo
+import os
 import re
 import markdown
 import pygments
 import pygments.formatters
 import pygments.lexers
-import frontmatter
+import yaml
 import scss
 
 
@@ -60,11 +62,14 @@ markdown_ctx = markdown.Markdown(extensions=[CodeBlockExtension()])
 
 class PostsCollection(collection.FileCollection):
     path = './posts/**.md'
+    cache_path = './.cache/posts.pickle'
 
     class Item(collection.FileCollectionItem):
         def __init__(self, fname):
-            post = frontmatter.load(fname)
-            super().__init__(fname, content=post.content, **post.metadata)
+            # Only the front matter is read now; content is read when used
+            header, offset = collection.read_front_matter(fname)
+            metadata = yaml.safe_load(header) or {}
+            super().__init__(fname, body_offset=offset, **metadata)
 
         @property
         def main_url(self):
@@ -74,7 +79,9 @@ class PostsCollection(collection.FileCollection):
                 slug = util.slugify_grow(self.title)
                 return f'/blog/{slug}'
 
-        @property
+        # Bump the version when changing the markdown extensions
+        @memo.memoized_property('content', version=1,
+                                store=memo.DiskStore('./.cache/html'))
         def html(self):
             return markdown_ctx.convert(self.content)
 
@@ -103,18 +110,45 @@ class BlogPostView(collection.ItemPerPageView):
         return item.main_url
 
 
+class ScssTransform(static.Transform):
+    extensions = ('.scss',)
+    content_type = 'text/css'
+    import_re = re.compile(r'@import\s+[\'"]([^\'"]+)[\'"]')
+
+    def apply(self, path):
+        return scss.compiler.compile_file(path).encode()
+
+    def _resolve_import(self, dirname, name):
+        # `@import "a/b"` could be a/b.scss or a/_b.scss
+        head, tail = os.path.split(name)
+        for candidate in [name, name + '.scss', os.path.join(head, '_' + tail),
+                          os.path.join(head, '_' + tail + '.scss')]:
+            candidate = os.path.join(dirname, candidate)
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def get_dependencies(self, path):
+        deps = []
+        to_scan = [path]
+        while to_scan:
+            fname = to_scan.pop()
+            with open(fname) as f:
+                names = self.import_re.findall(f.read())
+            for name in names:
+                dep = self._resolve_import(os.path.dirname(fname), name)
+                if dep is not None and dep not in deps:
+                    deps.append(dep)
+                    to_scan.append(dep)
+        return deps
+
+
 @site.register
 class MyStaticView(static.StaticView):
     template_filter_name = 'static_url'
     base = 'static'
     pathspec = Pathspec('/static/<*name>')
-
-    def read_path(self, path):
-        if path.endswith('.scss'):
-            data = scss.compiler.compile_file(path)
-            return data.encode()
-        else:
-            return super().read_path(path)
+    transforms = [ScssTransform()]
 
 
 site.cli()